@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        # подключаем обработчики сигналов, поддерживающие счетчики
+        from . import signals  # noqa
+        from .search import create_index
+
+        # таблица поискового индекса создается сырым SQL после migrate
+        post_migrate.connect(create_index, sender=self)
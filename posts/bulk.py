@@ -0,0 +1,201 @@
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from . import counters, generations, search, terms, timeline
+from .models import Group
+
+# Потоковые выгрузка и загрузка данных постов и пользователей.
+# Формат записей тот же, что у dumpdata/loaddata:
+# {"model": "posts.post", "pk": 1, "fields": {...}}, файл - массив JSON
+# или JSONL (по записи в строке). Файл читается по кускам, записи
+# вставляются через bulk_create пачками и без сигналов, а счетчики,
+# ленты и индексы пересчитываются один раз после загрузки.
+
+# модели в порядке зависимостей: сначала те, на которые ссылаются,
+# чтобы выгрузку можно было загрузить и обычным loaddata
+MODELS = [
+    "auth.user",
+    "posts.group",
+    "posts.post",
+    "posts.comment",
+    "posts.follow",
+]
+
+
+def iter_records(fp, chunk_size=64 * 1024):
+    """
+    Читает записи из массива JSON или из JSONL, не загружая файл
+    в память целиком
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    while True:
+        # пропускаем пробелы, запятые и открывающую скобку массива
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,[":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            record, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                if buffer[pos:].strip():
+                    raise
+                return
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield record
+
+
+def export_records(out, jsonl=True, batch_size=1000):
+    """
+    Пишет в out записи всех моделей из MODELS.
+    Возвращает Counter {модель: количество записей}.
+    """
+    exported = Counter()
+    separator = "\n" if jsonl else ",\n"
+    if not jsonl:
+        out.write("[\n")
+    first = True
+    for label in MODELS:
+        model = apps.get_model(label)
+        queryset = model._default_manager.order_by("pk")
+        for obj in queryset.iterator(chunk_size=batch_size):
+            record = serializers.serialize("python", [obj])[0]
+            if not first:
+                out.write(separator)
+            out.write(json.dumps(record, cls=DjangoJSONEncoder))
+            first = False
+            exported[label] += 1
+    out.write("\n" if jsonl else "\n]\n")
+    return exported
+
+
+def _m2m_rows(deserialized):
+    obj = deserialized.object
+    for name, ids in (deserialized.m2m_data or {}).items():
+        field = obj._meta.get_field(name)
+        through = field.remote_field.through
+        source = f"{field.m2m_field_name()}_id"
+        target = f"{field.m2m_reverse_field_name()}_id"
+        for pk in ids:
+            yield through(**{source: obj.pk, target: pk})
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """
+    Временно выключает auto_now_add у полей, чтобы bulk_create сохранил
+    переданные даты, а не время вставки. Действует на весь процесс,
+    поэтому годится только для команд, а не для запросов к сайту.
+    """
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _auto_now_add_fields(models):
+    return [
+        field
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now_add", False)
+    ]
+
+
+def _flush(model, objects, batch_size):
+    model._default_manager.bulk_create(objects, batch_size=batch_size)
+    objects.clear()
+
+
+def import_records(records, batch_size=1000):
+    """
+    Загружает записи моделей из MODELS, остальные пропускает.
+    Возвращает (Counter загруженных, Counter пропущенных).
+    Как и в loaddata, все идет одной транзакцией, а внешние ключи
+    проверяются в конце: в выгрузке dumpdata комментарии и подписки
+    могут идти раньше постов и пользователей. Даты публикации постов
+    и комментариев сохраняются из выгрузки.
+    """
+    imported = Counter()
+    skipped = Counter()
+    pending = defaultdict(list)
+    dates = _auto_now_add_fields(apps.get_model(label) for label in MODELS)
+    with transaction.atomic(), explicit_dates(*dates):
+        with connection.constraint_checks_disabled():
+            for record in records:
+                label = record.get("model", "").lower()
+                if label not in MODELS:
+                    skipped[label] += 1
+                    continue
+                for deserialized in serializers.deserialize(
+                    "python", [record], ignorenonexistent=True
+                ):
+                    obj = deserialized.object
+                    pending[type(obj)].append(obj)
+                    # строки таблиц many-to-many: группы и права пользователя
+                    for row in _m2m_rows(deserialized):
+                        pending[type(row)].append(row)
+                imported[label] += 1
+                for model, objects in pending.items():
+                    if len(objects) >= batch_size:
+                        _flush(model, objects, batch_size)
+            for model, objects in pending.items():
+                _flush(model, objects, batch_size)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in pending]
+        )
+    return imported, skipped
+
+
+def finish_import():
+    """
+    Пересчитывает после загрузки все, что обычно поддерживают сигналы:
+    последовательности первичных ключей, счетчики, ленты подписок,
+    поисковый индекс, индекс терминов, поколения кеша лент
+    """
+    models = [apps.get_model(label) for label in MODELS]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+    with transaction.atomic():
+        counters.rebuild_comment_counts()
+        counters.rebuild_group_post_counts()
+    counters.rebuild_user_stats()
+    timeline.rebuild_timelines()
+    search.rebuild_index()
+    terms.rebuild_terms()
+    slugs = Group.objects.values_list("slug", flat=True)
+    generations.bump("global", *(f"group:{slug}" for slug in slugs))
+
+
+class Timer:
+    """
+    Засекает время и считает скорость в строках в секунду
+    """
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.monotonic() - self.started
+
+    def rate(self, rows):
+        return rows / self.elapsed if self.elapsed else 0
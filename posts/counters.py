@@ -0,0 +1,120 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Post, Comment, Follow, Group, User, UserStats
+
+
+def _count_subquery(model, field):
+    # коррелированный подзапрос COUNT(*) по внешнему ключу field
+    rows = (
+        model.objects.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def change_comment_count(post_id, delta):
+    # обновляем счетчик одним UPDATE через F(), без чтения записи,
+    # поэтому одновременные комментарии не затирают друг друга
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F("comment_count") + delta
+    )
+
+
+def rebuild_comment_counts():
+    """
+    Пересчитывает счетчики комментариев всех постов по таблице комментариев.
+    Возвращает количество обновленных постов.
+    """
+    return Post.objects.update(
+        comment_count=_count_subquery(Comment, "post")
+    )
+
+
+def change_group_post_count(group_id, delta):
+    if group_id is None:
+        return
+    groups = Group.objects.filter(pk=group_id)
+    if delta < 0:
+        groups = groups.filter(post_count__gt=0)
+    groups.update(post_count=F("post_count") + delta)
+
+
+def rebuild_group_post_counts():
+    """
+    Пересчитывает счетчики записей сообществ по таблице постов.
+    Возвращает количество обновленных сообществ.
+    """
+    return Group.objects.update(post_count=_count_subquery(Post, "group"))
+
+
+def change_user_stats(user_id, field, delta):
+    """
+    Изменяет один из счетчиков UserStats на delta.
+    Если строки со счетчиками еще нет, она собирается заново
+    по исходным таблицам.
+    """
+    stats = UserStats.objects.filter(pk=user_id)
+    if delta < 0:
+        # при каскадном удалении пользователя его счетчики могут быть
+        # уже удалены - тогда пересоздавать их не нужно
+        stats.filter(**{f"{field}__gt": 0}).update(**{field: F(field) + delta})
+        return
+    if not stats.update(**{field: F(field) + delta}):
+        try:
+            rebuild_user_stats([user_id])
+        except IntegrityError:
+            # строку успел создать параллельный запрос
+            stats.update(**{field: F(field) + delta})
+
+
+def get_user_stats(user):
+    # счетчики пользователя одним запросом, при отсутствии - пересчитываем
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        rebuild_user_stats([user.pk])
+        return UserStats.objects.get(pk=user.pk)
+
+
+def rebuild_user_stats(user_ids=None, batch_size=1000):
+    """
+    Пересчитывает счетчики пользователей (всех или из списка user_ids)
+    по таблицам постов и подписок. Возвращает количество пересчитанных.
+    """
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    rows = (
+        users.order_by("pk")
+        .annotate(
+            posts_total=_count_subquery(Post, "author"),
+            followers_total=_count_subquery(Follow, "author"),
+            following_total=_count_subquery(Follow, "user"),
+        )
+        .values_list("pk", "posts_total", "followers_total", "following_total")
+    )
+    total = 0
+    with transaction.atomic():
+        UserStats.objects.filter(user__in=users).delete()
+        batch = []
+        for pk, posts, followers, following in rows.iterator():
+            batch.append(
+                UserStats(
+                    user_id=pk,
+                    posts_count=posts,
+                    followers_count=followers,
+                    following_count=following,
+                )
+            )
+            if len(batch) >= batch_size:
+                UserStats.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        UserStats.objects.bulk_create(batch)
+        total += len(batch)
+    return total
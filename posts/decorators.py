@@ -0,0 +1,175 @@
+import datetime as dt
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import condition
+
+from .generations import feed_version, get_generations
+from .uploads import BoundedUploadHandler
+from yatube.cache import stale_served
+
+# параметры запроса, от которых зависит содержимое страницы ленты
+PAGE_PARAMS = ("page", "after", "before")
+
+
+def is_anonymous_request(request):
+    # без cookie сессии и CSRF пользователь гарантированно анонимный,
+    # и проверка не требует обращения к сессии в базе
+    cookies = request.COOKIES
+    session = settings.SESSION_COOKIE_NAME in cookies
+    csrf = settings.CSRF_COOKIE_NAME in cookies
+    return request.method == "GET" and not session and not csrf
+
+
+def page_params(request):
+    return urlencode(
+        sorted(
+            (name, request.GET[name])
+            for name in PAGE_PARAMS
+            if name in request.GET
+        )
+    )
+
+
+def cache_anonymous_page(scopes):
+    """
+    Кеширует страницу целиком для анонимных читателей.
+    scopes - функция от аргументов view, возвращающая области
+    поколений (posts/generations.py), от которых зависит страница.
+    При записи поста, комментария или подписки поколение меняется,
+    и закешированная страница больше не отдается.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_anonymous_request(request):
+                return view(request, *args, **kwargs)
+            key = f"anonymous_page:{request.path}?{page_params(request)}"
+            version = feed_version(*scopes(*args, **kwargs))
+            cached = cache.get(key)
+            if cached is not None and cached[0] == version:
+                return HttpResponse(cached[1], content_type=cached[2])
+            token = stale_served.set(False)
+            try:
+                response = view(request, *args, **kwargs)
+                # страницы с CSRF-токеном привязаны к конкретному
+                # посетителю, а страницы с устаревшими фрагментами
+                # нельзя сохранять под новой версией
+                cacheable = response.status_code == 200 and not (
+                    request.META.get("CSRF_COOKIE_USED") or stale_served.get()
+                )
+            finally:
+                stale_served.reset(token)
+            if cacheable:
+                cache.set(
+                    key,
+                    (version, response.content, response["Content-Type"]),
+                    settings.FEED_CACHE_TIMEOUT,
+                )
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def conditional_page(scopes):
+    """
+    Условный GET: страница получает ETag и Last-Modified, и на повторный
+    запрос с теми же валидаторами отдается 304 Not Modified еще до
+    запросов к базе и рендера шаблонов.
+    Валидаторы строятся из поколений лент (posts/generations.py): они
+    сдвигаются при каждой публикации, правке и удалении постов, новых
+    комментариях и подписках, и время последнего сдвига хранится в них же.
+    В ETag входит и cookie CSRF: форма комментария в копии браузера
+    должна содержать действующий токен, а после входа он меняется.
+    Редиректы и ошибки валидаторов не получают.
+    """
+
+    def request_scopes(request, *args, **kwargs):
+        page_scopes = list(scopes(*args, **kwargs))
+        # меню и кнопки подписки зависят от подписок самого читателя
+        if not is_anonymous_request(request) and request.user.is_authenticated:
+            page_scopes.append(f"author:{request.user.username}")
+        return page_scopes
+
+    def etag(request, *args, **kwargs):
+        user_id = None
+        if not is_anonymous_request(request):
+            user_id = request.user.pk
+        raw = ":".join(
+            (
+                feed_version(*request_scopes(request, *args, **kwargs)),
+                request.path,
+                page_params(request),
+                str(user_id),
+                request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+            )
+        )
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        page_scopes = request_scopes(request, *args, **kwargs)
+        generations = get_generations(*page_scopes)
+        return dt.datetime.fromtimestamp(
+            max(generations.values()) / 1000, tz=dt.timezone.utc
+        )
+
+    def decorator(view):
+        conditional_view = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                del response["ETag"]
+                del response["Last-Modified"]
+            # браузер и nginx должны каждый раз проверять валидаторы,
+            # а не показывать копию по эвристике свежести
+            patch_cache_control(
+                response,
+                no_cache=True,
+                private=not is_anonymous_request(request),
+            )
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def cached_page(scopes):
+    """
+    Условный GET и кеш страницы для анонимных читателей вместе
+    """
+
+    def decorator(view):
+        return conditional_page(scopes)(cache_anonymous_page(scopes)(view))
+
+    return decorator
+
+
+def bounded_uploads(view):
+    """
+    Ставит BoundedUploadHandler первым обработчиком загрузок только
+    для этого представления, остальные загрузки сайта (например,
+    в админке) лимитом картинок постов не ограничены. Обработчики можно
+    менять только до чтения тела запроса, а CsrfViewMiddleware читает
+    его раньше представления, поэтому проверка CSRF переносится внутрь.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers.insert(0, BoundedUploadHandler(request))
+        return protected(request, *args, **kwargs)
+
+    return wrapper
@@ -1,8 +1,11 @@
 from django.forms import ModelForm
+from django.core.files.uploadedfile import UploadedFile
 from captcha.fields import CaptchaField
 from django.conf import settings
 
 from .models import Post, Comment
+from .uploads import check_image_header, normalize_image
+from .validators import validate_file_size
 
 
 class PostForm(ModelForm):
@@ -18,6 +21,17 @@ class PostForm(ModelForm):
             "image",
         ]
 
+    def clean_image(self):
+        # новую загрузку проверяем по размеру и заголовку и перекодируем,
+        # уже сохраненную картинку не трогаем. Стандартная проверка
+        # ImageField до этого только читает заголовок, не декодируя файл
+        image = self.cleaned_data.get("image")
+        if not isinstance(image, UploadedFile):
+            return image
+        validate_file_size(image)
+        check_image_header(image)
+        return normalize_image(image)
+
 
 class CommentForm(ModelForm):
     """
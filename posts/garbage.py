@@ -0,0 +1,90 @@
+import datetime as dt
+
+from django.conf import settings
+from django.utils import timezone
+from sorl.thumbnail import default
+
+from . import variants
+from .models import Post
+from .storage import walk
+
+# Сборщик мусора в MEDIA_ROOT: оригиналы картинок, миниатюры sorl
+# и варианты для srcset, на которые не ссылается ни один пост.
+# Имена всех нужных файлов вычисляются из Post.image, поэтому
+# хранилище ключей sorl обходить не нужно.
+
+# каталоги хранилища, в которых лежат файлы картинок постов
+MEDIA_DIRECTORIES = ("posts", "cache", "variants")
+# каталог оригиналов, остальные файлы строятся по ним заново
+ORIGINALS_DIRECTORY = "posts"
+
+
+def referenced_names():
+    """
+    Множество имен файлов, которые нужны существующим постам
+    """
+    names = set()
+    images = (
+        Post.objects.exclude(image="")
+        .values_list("image", flat=True)
+        .distinct()
+        .iterator()
+    )
+    for name in images:
+        names.add(name)
+        for geometry, options in settings.POST_THUMBNAILS.values():
+            thumbnail = default.backend.thumbnail_file(
+                name, geometry, dict(options)
+            )
+            names.add(thumbnail.name)
+        for width in settings.POST_IMAGE_WIDTHS:
+            for fmt in variants.EXTENSIONS:
+                names.add(variants.variant_name(name, width, fmt))
+    return names
+
+
+def find_garbage(min_age=dt.timedelta(hours=1), after=None):
+    """
+    Перебирает файлы картинок, на которые не ссылается ни один пост.
+    Файлы моложе min_age пропускаются: пост с ними мог еще
+    не закоммититься. Обход идет в порядке сортировки имен, after -
+    имя, после которого его нужно продолжить.
+    Возвращает пары (имя, размер в байтах).
+    """
+    storage = default.storage
+    referenced = referenced_names()
+    threshold = timezone.now() - min_age
+    position = after.split("/") if after else None
+    for directory in sorted(MEDIA_DIRECTORIES):
+        if not storage.exists(directory):
+            continue
+        if position and [directory] < position[:1]:
+            continue
+        for name in walk(storage, directory):
+            if position and name.split("/") <= position:
+                continue
+            if name in referenced:
+                continue
+            if storage.get_modified_time(name) > threshold:
+                continue
+            yield name, storage.size(name)
+
+
+def delete_garbage(name, min_age=dt.timedelta(hours=1)):
+    """
+    Удаляет файл, найденный find_garbage. Между обходом и удалением
+    оригинал могла переиспользовать загрузка с тем же хешем, поэтому
+    под блокировкой хранилища проверки повторяются, как в
+    thumbnails.release. Возвращает True, если файл удален.
+    """
+    storage = Post._meta.get_field("image").storage
+    if name.split("/")[0] != ORIGINALS_DIRECTORY:
+        storage.delete(name)
+        return True
+    with storage.locked(name):
+        if storage.recently_modified(name, min_age.total_seconds()):
+            return False
+        if Post.objects.filter(image=name).exists():
+            return False
+        storage.delete(name)
+    return True
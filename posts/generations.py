@@ -0,0 +1,82 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Поколения лент. Каждая лента описывается набором областей:
+# "global" - любые посты и комментарии, "group:<slug>" - посты сообщества,
+# "author:<username>" - посты, комментарии и подписки пользователя.
+# Значение поколения - время последнего изменения области в миллисекундах,
+# оно входит в ключи кеша, поэтому после записи старые страницы
+# просто перестают запрашиваться и устаревают сами. Области, сдвинутые
+# одним вызовом bump, получают одно и то же значение, поэтому в ключ
+# фрагмента кроме поколения входит и сама область: имя автора, slug.
+
+
+def _key(scope):
+    return f"feed_generation:{scope}"
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def get_generations(*scopes):
+    """
+    Возвращает словарь {область: поколение}. Если поколение области
+    вытеснено из кеша, оно начинается заново с текущего времени.
+    """
+    keys = {_key(scope): scope for scope in scopes}
+    values = cache.get_many(list(keys))
+    generations = {}
+    for key, scope in keys.items():
+        if key not in values:
+            values[key] = _now()
+            cache.add(key, values[key], timeout=None)
+        generations[scope] = values[key]
+    return generations
+
+
+def feed_version(*scopes):
+    # строка для ключа кеша, меняется при изменении любой из областей
+    generations = get_generations(*scopes)
+    return "-".join(str(generations[scope]) for scope in scopes)
+
+
+def feed_cache_context(*scopes):
+    """
+    Переменные шаблона для тега {% cache %} ленты
+    """
+    return {
+        "feed_version": feed_version(*scopes),
+        "feed_cache_timeout": settings.FEED_CACHE_TIMEOUT,
+    }
+
+
+def bump(*scopes):
+    """
+    Сдвигает поколения областей. Внутри транзакции сдвиг повторяется
+    после коммита: параллельный запрос мог успеть закешировать
+    старые данные уже под новым поколением.
+    """
+    _bump_now(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_now(scopes))
+
+
+def _bump_now(scopes):
+    keys = [_key(scope) for scope in scopes]
+    current = cache.get_many(keys)
+    now = _now()
+    cache.set_many(
+        {key: max(now, current.get(key, 0) + 1) for key in keys},
+        timeout=None,
+    )
+
+
+def post_scopes(author_username, group_slug=None):
+    scopes = ["global", f"author:{author_username}"]
+    if group_slug:
+        scopes.append(f"group:{group_slug}")
+    return scopes
@@ -0,0 +1,102 @@
+import datetime as dt
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.garbage import delete_garbage, find_garbage
+
+# имя файла, на котором остановился прошлый запуск с --limit
+CURSOR_KEY = "collect_media_garbage:cursor"
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет картинки, миниатюры и варианты картинок, на которые "
+        "не ссылается ни один пост"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, сколько файлов и байт будет удалено",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=400,
+            help="Количество файлов, записи о которых удаляются из "
+            "хранилища ключей sorl одним запросом",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=60,
+            help="Не трогать файлы моложе этого количества минут",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Удалить не больше стольких файлов за запуск, "
+            "следующий запуск продолжит обход с места остановки",
+        )
+
+    def handle(self, *args, **options):
+        after = None if options["dry_run"] else cache.get(CURSOR_KEY)
+        min_age = dt.timedelta(minutes=options["min_age"])
+        garbage = find_garbage(min_age, after=after)
+        seen = total = reclaimed = 0
+        batch = []
+        finished = True
+        for name, size in garbage:
+            if options["limit"] is not None and seen >= options["limit"]:
+                finished = False
+                break
+            seen += 1
+            if options["dry_run"]:
+                total += 1
+                reclaimed += size
+                self.stdout.write(f"{name} ({size} байт)")
+                continue
+            batch.append((name, size))
+            if len(batch) >= options["batch_size"]:
+                deleted, size = self._delete(batch, min_age)
+                total += deleted
+                reclaimed += size
+                batch = []
+        if not options["dry_run"]:
+            deleted, size = self._delete(batch, min_age)
+            total += deleted
+            reclaimed += size
+            if finished:
+                cache.delete(CURSOR_KEY)
+        action = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action} файлов: {total}, "
+                f"освобождено {reclaimed / (1024 * 1024):.1f} Мбайт"
+            )
+        )
+
+    def _delete(self, batch, min_age):
+        """
+        Удаляет пачку файлов, возвращает (количество, байт)
+        """
+        if not batch:
+            return 0, 0
+        deleted = [
+            (name, size)
+            for name, size in batch
+            if delete_garbage(name, min_age)
+        ]
+        # записи хранилища ключей sorl только об удаленных файлах,
+        # без обхода всего хранилища (kvstore.cleanup)
+        default.kvstore.delete_many(
+            ImageFile(name, default.storage) for name, _ in deleted
+        )
+        # пачка обработана, следующий запуск начнет после нее
+        cache.set(CURSOR_KEY, batch[-1][0], timeout=None)
+        return len(deleted), sum(size for _, size in deleted)
@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает пользователей, сообщества, посты, комментарии "
+        "и подписки потоком в JSONL (или JSON) для import_data и loaddata"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-o", "--output", default="-", help="файл, '-' для stdout"
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="массив JSON вместо JSONL, как у dumpdata",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="количество строк, читаемых из базы за раз",
+        )
+
+    def handle(self, *args, **options):
+        if options["output"] == "-":
+            out = sys.stdout
+        else:
+            out = open(options["output"], "w", encoding="utf-8")
+        try:
+            with bulk.Timer() as timer:
+                exported = bulk.export_records(
+                    out, not options["json"], options["batch_size"]
+                )
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        total = sum(exported.values())
+        # отчет в stderr, чтобы не смешивать его с данными в stdout
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Выгружено записей: {total} за {timer.elapsed:.1f} с "
+                f"({timer.rate(total):.0f} в секунду)"
+            )
+        )
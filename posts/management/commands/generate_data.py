@@ -0,0 +1,109 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts import bulk
+from posts.synthetic import EPOCH, generate
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими пользователями, сообществами, "
+        "постами, комментариями и подписками для замеров производительности. "
+        "Одинаковый --seed дает одинаковые данные."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument(
+            "--comments",
+            type=float,
+            default=3.0,
+            help="в среднем комментариев на пост",
+        )
+        parser.add_argument(
+            "--follows",
+            type=float,
+            default=10.0,
+            help="в среднем подписок на пользователя",
+        )
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=0,
+            help="количество разных картинок для постов",
+        )
+        parser.add_argument(
+            "--image-ratio",
+            type=float,
+            default=0.3,
+            help="доля постов с картинкой",
+        )
+        parser.add_argument(
+            "--alpha",
+            type=float,
+            default=1.1,
+            help="показатель распределения Ципфа: чем больше, "
+            "тем сильнее популярность сосредоточена у немногих",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="за сколько дней до --now разбросаны даты публикаций",
+        )
+        parser.add_argument(
+            "--now",
+            type=dt.datetime.fromisoformat,
+            default=EPOCH,
+            help="момент, от которого отсчитываются даты, в формате ISO "
+            f"(по умолчанию {EPOCH:%Y-%m-%d}); "
+            "одинаковый --now нужен для одинаковых данных",
+        )
+        parser.add_argument(
+            "--password",
+            default="12345",
+            help="пароль всех созданных пользователей",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 and options["posts"] > 0:
+            raise CommandError("Для постов нужен хотя бы один пользователь")
+        now = options["now"]
+        if timezone.is_naive(now):
+            now = timezone.make_aware(now)
+        with bulk.Timer() as timer:
+            created = generate(
+                seed=options["seed"],
+                users=options["users"],
+                groups=options["groups"],
+                posts=options["posts"],
+                comments=options["comments"],
+                follows=options["follows"],
+                images=options["images"],
+                image_ratio=options["image_ratio"],
+                alpha=options["alpha"],
+                days=options["days"],
+                now=now,
+                password=options["password"],
+                batch_size=options["batch_size"],
+            )
+        for name, rows in created.items():
+            self.stdout.write(f"{name}: {rows}")
+        total = sum(created.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано записей: {total} за {timer.elapsed:.1f} с "
+                f"({timer.rate(total):.0f} в секунду)"
+            )
+        )
+        if options["images"]:
+            self.stdout.write(
+                "Миниатюры картинок можно построить заранее командой "
+                "warm_thumbnails"
+            )
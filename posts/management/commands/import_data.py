@@ -0,0 +1,53 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Быстро загружает пользователей, сообщества, посты, комментарии "
+        "и подписки из JSON или JSONL в формате dumpdata: пачками через "
+        "bulk_create, со сборкой счетчиков, лент и индексов в конце"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="файл с данными, '-' для stdin")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="количество строк в одном INSERT",
+        )
+
+    def handle(self, *args, **options):
+        if options["path"] == "-":
+            fp = sys.stdin
+        else:
+            fp = open(options["path"], encoding="utf-8")
+        try:
+            with bulk.Timer() as loading:
+                imported, skipped = bulk.import_records(
+                    bulk.iter_records(fp), options["batch_size"]
+                )
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+        for label, rows in imported.items():
+            self.stdout.write(f"{label}: {rows}")
+        for label, rows in skipped.items():
+            self.stdout.write(f"{label}: {rows} (пропущено)")
+        total = sum(imported.values())
+        self.stdout.write(
+            f"Загружено записей: {total} за {loading.elapsed:.1f} с "
+            f"({loading.rate(total):.0f} в секунду)"
+        )
+        with bulk.Timer() as finishing:
+            bulk.finish_import()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Счетчики, ленты и индексы собраны "
+                f"за {finishing.elapsed:.1f} с"
+            )
+        )
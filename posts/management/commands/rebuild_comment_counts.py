@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import rebuild_comment_counts
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики комментариев постов по таблице комментариев"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_comment_counts()
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересчитаны счетчики комментариев: {updated}")
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import rebuild_group_post_counts
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики записей сообществ по таблице постов"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_group_post_counts()
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересчитаны счетчики сообществ: {updated}")
+        )
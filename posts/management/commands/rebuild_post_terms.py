@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts.terms import rebuild_terms
+
+
+class Command(BaseCommand):
+    help = "Заполняет заново индекс хештегов и упоминаний по текстам постов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество постов, обрабатываемых за один проход",
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_terms(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Записей в индексе терминов: {total}")
+        )
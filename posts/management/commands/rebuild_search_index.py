@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import create_index, rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет заново поисковый индекс по текстам постов, "
+        "названиям сообществ и комментариям"
+    )
+
+    def handle(self, *args, **options):
+        create_index()
+        total = rebuild_index()
+        self.stdout.write(
+            self.style.SUCCESS(f"Проиндексировано постов: {total}")
+        )
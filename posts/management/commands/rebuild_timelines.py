@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = "Собирает ленты подписок заново по таблицам подписок и постов"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_timelines()
+        self.stdout.write(
+            self.style.SUCCESS(f"Ленты собраны, обработано подписок: {total}")
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счетчики пользователей (записи, подписчики, подписки) "
+        "по таблицам постов и подписок"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество строк в одном INSERT",
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_user_stats(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересчитаны счетчики пользователей: {total}")
+        )
@@ -0,0 +1,35 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts.storage import walk
+from posts.thumbnails import pregenerate
+
+
+class Command(BaseCommand):
+    help = (
+        "Заранее строит миниатюры и варианты всех картинок в media/posts "
+        "и заполняет хранилище ключей sorl"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default="posts",
+            help="Каталог с картинками внутри MEDIA_ROOT",
+        )
+
+    def handle(self, *args, **options):
+        total = failed = 0
+        for name in walk(default_storage, options["path"]):
+            try:
+                pregenerate(name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f"{name}: {error}")
+                continue
+            total += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Построены миниатюры картинок: {total}, с ошибками: {failed}"
+            )
+        )
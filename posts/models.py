@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from .storage import post_image_storage
 from .validators import validate_file_size
 
 
@@ -14,6 +15,10 @@ class Group(models.Model):
     title = models.CharField(max_length=200, unique=True)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    # счетчик записей поддерживается сигналами (posts/signals.py)
+    post_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="количество записей"
+    )
 
     def __str__(self):
         return self.title
@@ -40,10 +45,34 @@ class Post(models.Model):
     )
     image = models.ImageField(
         upload_to="posts/",
+        # одинаковые картинки хранятся одним файлом (posts/storage.py)
+        storage=post_image_storage,
         blank=True,
         validators=[validate_file_size],
         verbose_name="изображение",
     )
+    # счетчик комментариев поддерживается сигналами (posts/signals.py),
+    # чтобы лентам не приходилось делать GROUP BY по таблице комментариев
+    comment_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="количество комментариев"
+    )
+    # ширины построенных вариантов картинки через запятую (posts/variants.py)
+    image_variants = models.CharField(
+        max_length=100, blank=True, editable=False
+    )
+
+    class Meta:
+        # ленты сообщества и автора читаются по этим индексам
+        # сразу в порядке публикации, без сортировки
+        indexes = [
+            models.Index(
+                fields=["group", "-pub_date"], name="post_group_pub_date_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date"],
+                name="post_author_pub_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.text
@@ -87,3 +116,71 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ["author", "user"]
+
+
+class UserStats(models.Model):
+    """
+    Материализованные счетчики пользователя: записи, подписчики и подписки.
+    Поддерживаются сигналами (posts/signals.py), пересчитываются
+    командой rebuild_user_stats.
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    # подписчики - сколько пользователей подписаны на автора
+    followers_count = models.PositiveIntegerField(default=0)
+    # подписки - на скольких авторов подписан пользователь
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class TimelineEntry(models.Model):
+    """
+    Предрассчитанная лента подписок: запись о том, что пост автора
+    попал в ленту подписчика. Заполняется при публикации (posts/timeline.py)
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    # копия Post.pub_date: лента читается по индексу записей
+    # сразу в порядке публикации, без сортировки всей ленты
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ["user", "post"]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="timeline_user_pub_date_idx",
+            ),
+        ]
+
+
+class PostTerm(models.Model):
+    """
+    Обратный индекс хештегов и упоминаний: запись о том, что в тексте
+    поста встречается "#тег" или "@пользователь". Заполняется при
+    сохранении поста (posts/terms.py)
+    """
+
+    term = models.CharField(max_length=160)
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="terms"
+    )
+    # копия Post.pub_date: лента тега читается по индексу терминов
+    # сразу в порядке публикации, без соединения со всеми постами тега
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ["term", "post"]
+        indexes = [
+            models.Index(
+                fields=["term", "-pub_date", "-post"],
+                name="postterm_term_pub_date_idx",
+            ),
+        ]
@@ -0,0 +1,181 @@
+import base64
+import binascii
+from collections.abc import Sequence
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def encode_cursor(pub_date, pk):
+    """
+    Упаковывает позицию записи в ленте (pub_date, id) в непрозрачный токен
+    """
+    raw = f"{pub_date.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Распаковывает токен обратно в (pub_date, id).
+    Для испорченного или подделанного токена возвращает None.
+    """
+    if not token:
+        return None
+    try:
+        padding = "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        pub_date, pk = raw.rsplit("|", 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод ленты по ключу (pub_date, id) вместо OFFSET.
+    Не делает COUNT(*) и одинаково быстро отдает любую страницу,
+    так как всегда начинает чтение индекса pub_date с позиции курсора.
+    """
+
+    def __init__(
+        self,
+        object_list,
+        per_page,
+        prefetch=None,
+        id_field="id",
+        item=None,
+        merge=None,
+    ):
+        # id_field - поле, которое вместе с pub_date задает порядок;
+        # для индексов вроде PostTerm это post_id, а item(row) достает
+        # из записи индекса сам пост
+        self.id_field = id_field
+        self.item = item
+        self.object_list = object_list.order_by("-pub_date", f"-{id_field}")
+        # merge - второй источник уже готовых записей (например, постов)
+        # с порядком (pub_date, id); его окно вливается в окно
+        # object_list, повторы по id отбрасываются
+        self.merge = None
+        if merge is not None:
+            self.merge = merge.order_by("-pub_date", "-id")
+        self.per_page = int(per_page)
+        # prefetch(rows) дополняет записи страницы после их загрузки,
+        # например, адресами миниатюр
+        self.prefetch = prefetch
+
+    def get_page(self, after=None, before=None):
+        # битый курсор отдает первую страницу, как Paginator.get_page
+        # поступает с неправильным номером страницы
+        after_key = decode_cursor(after)
+        before_key = None if after_key else decode_cursor(before)
+        return KeysetPage(self, after_key, before_key)
+
+    def get_page_from_request(self, request):
+        return self.get_page(
+            after=request.GET.get("after"), before=request.GET.get("before")
+        )
+
+
+class KeysetPage(Sequence):
+    """
+    Страница ленты, совместимая с Page по интерфейсу, который
+    используется в шаблонах (итерация, has_next/has_previous, has_other_pages).
+    Записи запрашиваются из базы только при первом обращении.
+    """
+
+    def __init__(self, paginator, after=None, before=None):
+        self.paginator = paginator
+        self.after = after
+        self.before = before
+
+    def __repr__(self):
+        return f"<KeysetPage {self.cursor or 'first'}>"
+
+    @cached_property
+    def cursor(self):
+        # нормализованный курсор текущей страницы, пригоден для ключей кеша
+        if self.after:
+            return "after:" + encode_cursor(*self.after)
+        if self.before:
+            return "before:" + encode_cursor(*self.before)
+        return ""
+
+    def _slice(self, queryset, id_field):
+        # per_page + 1 записей от курсора: лишняя показывает,
+        # есть ли записи дальше
+        if self.after:
+            pub_date, pk = self.after
+            same_date = Q(pub_date=pub_date, **{f"{id_field}__lt": pk})
+            queryset = queryset.filter(Q(pub_date__lt=pub_date) | same_date)
+        elif self.before:
+            pub_date, pk = self.before
+            # идем по индексу в обратную сторону, затем разворачиваем
+            same_date = Q(pub_date=pub_date, **{f"{id_field}__gt": pk})
+            queryset = queryset.filter(
+                Q(pub_date__gt=pub_date) | same_date
+            ).reverse()
+        return list(queryset[: self.paginator.per_page + 1])
+
+    @cached_property
+    def _window(self):
+        per_page = self.paginator.per_page
+        rows = self._slice(
+            self.paginator.object_list, self.paginator.id_field
+        )
+        if self.paginator.item is not None:
+            rows = [self.paginator.item(row) for row in rows]
+        if self.paginator.merge is not None:
+            # первые per_page + 1 записей объединения всегда лежат
+            # среди первых per_page + 1 записей каждого из источников
+            merged = {}
+            for row in rows + self._slice(self.paginator.merge, "id"):
+                merged.setdefault(row.pk, row)
+            rows = sorted(
+                merged.values(),
+                key=lambda row: (row.pub_date, row.pk),
+                reverse=not self.before,
+            )
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if self.paginator.prefetch is not None:
+            self.paginator.prefetch(rows)
+        if self.before:
+            rows.reverse()
+            return rows, True, has_more
+        return rows, has_more, bool(self.after)
+
+    @property
+    def object_list(self):
+        return self._window[0]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._window[1]
+
+    def has_previous(self):
+        return self._window[2]
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(last.pub_date, last.pk)
+
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(first.pub_date, first.pk)
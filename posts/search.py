@@ -0,0 +1,359 @@
+import base64
+import binascii
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db import connection, connections, transaction
+
+from .models import Comment, Post
+
+# Полнотекстовый поиск по постам: текст поста, название сообщества
+# и комментарии. На PostgreSQL документ хранится как tsvector с GIN-индексом
+# и стеммингом конфигурации russian, на SQLite - в таблице FTS5,
+# куда слова попадают уже приведенными к основе (см. stem).
+# Таблицы создаются сырым SQL после migrate (PostsConfig.ready),
+# т. к. ни tsvector, ни виртуальные таблицы FTS5 не описываются моделями.
+
+TABLE = "posts_search"
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "text, group_title, comments, tokenize='unicode61 remove_diacritics 2')",
+]
+
+POSTGRES_SCHEMA = [
+    f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+    "post_id integer PRIMARY KEY "
+    "REFERENCES posts_post (id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_document "
+    f"ON {TABLE} USING GIN (document)",
+]
+
+# веса частей документа: текст поста важнее сообщества и комментариев
+WEIGHTS = (10.0, 5.0, 1.0)
+
+WORD = re.compile(r"\w+")
+
+# окончания русских слов, от длинных к коротким
+ENDINGS = sorted(
+    (
+        "иями ями ами ией иях ого его ому ему ыми ими ешь ете ишь ите ают "
+        "яют ует уют ала ила ыла ела ать ять ить еть уть ия ие ые ое ее ая "
+        "яя ую юю ой ей ий ый ом ем ам ям ах ях ию ья ье ьи ью ов ев ит ет "
+        "ут ют ат ят ли ла ло а я о е и ы у ю ь й"
+    ).split(),
+    key=len,
+    reverse=True,
+)
+
+
+# слова в текстах повторяются, а перебор окончаний не бесплатный
+@lru_cache(maxsize=100000)
+def stem(word):
+    """
+    Облегченный стеммер для русского: отрезает возвратную частицу
+    и одно окончание, оставляя основу не короче трех букв
+    """
+    word = word.lower().replace("ё", "е")
+    for particle in ("ся", "сь"):
+        if word.endswith(particle) and len(word) - 2 >= 3:
+            word = word[:-2]
+            break
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[: -len(ending)]
+    return word
+
+
+def stem_text(text):
+    return " ".join(stem(word) for word in WORD.findall(text or ""))
+
+
+def _is_postgres(using=None):
+    db = connections[using] if using else connection
+    return db.vendor == "postgresql"
+
+
+def create_index(using="default", **kwargs):
+    """
+    Обработчик post_migrate: создает таблицу поискового индекса
+    """
+    db = connections[using]
+    schema = POSTGRES_SCHEMA if _is_postgres(using) else SQLITE_SCHEMA
+    with db.cursor() as cursor:
+        for statement in schema:
+            cursor.execute(statement)
+
+
+def _store(documents):
+    """
+    Записывает в индекс документы [(id поста, текст, название
+    сообщества, текст комментариев)]
+    """
+    with connection.cursor() as cursor:
+        if _is_postgres():
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (post_id, document) VALUES (%s, "
+                "setweight(to_tsvector('russian', %s), 'A') || "
+                "setweight(to_tsvector('russian', %s), 'B') || "
+                "setweight(to_tsvector('russian', %s), 'C')) "
+                "ON CONFLICT (post_id) DO UPDATE "
+                "SET document = EXCLUDED.document",
+                [
+                    (post_id, text, group_title or "", comments)
+                    for post_id, text, group_title, comments in documents
+                ],
+            )
+            return
+        cursor.executemany(
+            f"DELETE FROM {TABLE} WHERE rowid = %s",
+            [(document[0],) for document in documents],
+        )
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, text, group_title, comments) "
+            "VALUES (%s, %s, %s, %s)",
+            [
+                (
+                    post_id,
+                    stem_text(text),
+                    stem_text(group_title),
+                    stem_text(comments),
+                )
+                for post_id, text, group_title, comments in documents
+            ],
+        )
+
+
+def index_post(post_id):
+    """
+    Записывает в индекс текущее состояние поста и его комментариев
+    """
+    row = (
+        Post.objects.filter(pk=post_id)
+        .values_list("text", "group__title")
+        .first()
+    )
+    if row is None:
+        remove_post(post_id)
+        return
+    text, group_title = row
+    comments = " ".join(
+        Comment.objects.filter(post=post_id).values_list("text", flat=True)
+    )
+    _store([(post_id, text, group_title, comments)])
+
+
+def add_comment(post_id, text):
+    """
+    Дописывает к документу поста текст нового комментария,
+    не перечитывая остальные комментарии поста
+    """
+    with connection.cursor() as cursor:
+        if _is_postgres():
+            cursor.execute(
+                f"UPDATE {TABLE} SET document = document || "
+                "setweight(to_tsvector('russian', %s), 'C') "
+                "WHERE post_id = %s",
+                [text, post_id],
+            )
+        else:
+            cursor.execute(
+                f"UPDATE {TABLE} SET comments = comments || ' ' || %s "
+                "WHERE rowid = %s",
+                [stem_text(text), post_id],
+            )
+        indexed = cursor.rowcount > 0
+    if not indexed:
+        # поста еще нет в индексе (например, индекс не собран)
+        index_post(post_id)
+
+
+def remove_comment(post_id, text):
+    """
+    Убирает из документа поста текст удаленного комментария. На SQLite
+    из уже приведенных к основе слов вырезается первое вхождение слов
+    комментария; tsvector так не разобрать, и на PostgreSQL документ
+    собирается заново.
+    """
+    if _is_postgres():
+        index_post(post_id)
+        return
+    removed = stem_text(text).split()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT comments FROM {TABLE} WHERE rowid = %s", [post_id]
+        )
+        row = cursor.fetchone()
+    words = row[0].split() if row else []
+    size = len(removed)
+    for start in range(len(words) - size + 1):
+        if words[start:start + size] == removed:
+            del words[start:start + size]
+            break
+    else:
+        index_post(post_id)
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {TABLE} SET comments = %s WHERE rowid = %s",
+            [" ".join(words), post_id],
+        )
+
+
+def remove_post(post_id):
+    column = "post_id" if _is_postgres() else "rowid"
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE {column} = %s", [post_id])
+
+
+def index_group(group_id):
+    # название сообщества входит в документы всех его постов
+    posts = Post.objects.filter(group=group_id).values_list("pk", flat=True)
+    for post_id in posts.iterator():
+        index_post(post_id)
+
+
+@transaction.atomic
+def rebuild_index(batch_size=1000):
+    """
+    Заполняет индекс заново по всем постам, порциями по batch_size
+    постов, в одной транзакции: пока индекс собирается, и после
+    ошибки поиск видит прежний индекс. Возвращает число постов.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    total = 0
+    last_pk = 0
+    while True:
+        posts = list(
+            Post.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "text", "group__title")[:batch_size]
+        )
+        if not posts:
+            return total
+        comments = defaultdict(list)
+        rows = (
+            Comment.objects.filter(post__in=[row[0] for row in posts])
+            .order_by("pk")
+            .values_list("post_id", "text")
+        )
+        for post_id, text in rows:
+            comments[post_id].append(text)
+        _store(
+            [
+                (pk, text, group_title, " ".join(comments[pk]))
+                for pk, text, group_title in posts
+            ]
+        )
+        total += len(posts)
+        last_pk = posts[-1][0]
+
+
+def encode_cursor(score, pk):
+    raw = f"{score!r}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    # для испорченного токена возвращает None, как posts.paginator
+    if not token:
+        return None
+    try:
+        padding = "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        score, pk = raw.rsplit("|", 1)
+        return float(score), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _match_query(query):
+    # каждое слово запроса ищется по основе как префикс
+    stems = [stem(word) for word in WORD.findall(query)][:10]
+    return " ".join(f'"{word}"*' for word in stems)
+
+
+def search(query, after=None, limit=10):
+    """
+    Возвращает [(id поста, релевантность)] по убыванию релевантности,
+    начиная после позиции after = (релевантность, id)
+    """
+    score, pk = after if after else (None, None)
+    if _is_postgres():
+        sql = (
+            "SELECT post_id, score FROM ("
+            "SELECT post_id, ts_rank(document, query) AS score "
+            f"FROM {TABLE}, plainto_tsquery('russian', %s) query "
+            "WHERE document @@ query) ranked "
+        )
+        params = [query]
+    else:
+        match = _match_query(query)
+        if not match:
+            return []
+        weights = ", ".join(str(weight) for weight in WEIGHTS)
+        # bm25 тем меньше, чем документ релевантнее
+        sql = (
+            "SELECT post_id, score FROM ("
+            f"SELECT rowid AS post_id, -bm25({TABLE}, {weights}) AS score "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s) ranked "
+        )
+        params = [match]
+    if after:
+        sql += "WHERE score < %s OR (score = %s AND post_id < %s) "
+        params += [score, score, pk]
+    sql += "ORDER BY score DESC, post_id DESC LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+class SearchPage:
+    """
+    Страница результатов поиска с курсором по (релевантность, id).
+    Интерфейс тот же, что у KeysetPage, но листать можно только вперед.
+    """
+
+    def __init__(self, query, per_page, after=None, prefetch=None):
+        self.query = query
+        self.per_page = per_page
+        self.after = decode_cursor(after)
+        rows = search(query, self.after, per_page + 1) if query else []
+        self._has_next = len(rows) > per_page
+        self.rows = rows[:per_page]
+        posts = Post.objects.select_related("author", "group").in_bulk(
+            [post_id for post_id, _ in self.rows]
+        )
+        # посты, удаленные после поиска, пропускаем
+        self.object_list = [
+            posts[post_id] for post_id, _ in self.rows if post_id in posts
+        ]
+        if prefetch is not None:
+            prefetch(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return False
+
+    def has_other_pages(self):
+        return self.has_next()
+
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return encode_cursor(*reversed(self.rows[-1]))
+
+    def previous_cursor(self):
+        return None
@@ -0,0 +1,196 @@
+import contextvars
+
+from django.db import transaction
+from django.db.models.signals import (
+    pre_save,
+    post_save,
+    pre_delete,
+    post_delete,
+)
+from django.dispatch import receiver
+
+from . import counters, generations, search, terms, thumbnails, timeline
+from .models import Post, Comment, Follow, Group, User
+
+
+# посты, которые сейчас удаляются: их комментарии удаляются каскадом,
+# и пересчитывать для каждого счетчик, поисковый документ и поколения
+# лент незачем, post_deleted делает это один раз за весь пост
+deleting_posts = contextvars.ContextVar("deleting_posts", default=frozenset())
+
+
+def _bump_post(post_id):
+    # сбрасываем кеш лент, в которых показан пост
+    row = (
+        Post.objects.filter(pk=post_id)
+        .values_list("author__username", "group__slug")
+        .first()
+    )
+    if row is not None:
+        generations.bump(*generations.post_scopes(*row))
+
+
+def _bump_users(*user_ids):
+    usernames = User.objects.filter(pk__in=user_ids).values_list(
+        "username", flat=True
+    )
+    generations.bump(*(f"author:{username}" for username in usernames))
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comment_count(instance.post_id, 1)
+        # в документ поста дописывается только новый комментарий
+        search.add_comment(instance.post_id, instance.text)
+    else:
+        search.index_post(instance.post_id)
+    _bump_post(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # срабатывает и при каскадном удалении комментариев
+    # вместе с их автором или постом
+    if instance.post_id in deleting_posts.get():
+        return
+    counters.change_comment_count(instance.post_id, -1)
+    search.remove_comment(instance.post_id, instance.text)
+    _bump_post(instance.post_id)
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, **kwargs):
+    # новая или удаленная картинка: варианты старой больше не подходят.
+    # Файл новой загрузки еще не сохранен в хранилище до pre_save поля
+    image_changed = not instance.image or not instance.image._committed
+    if image_changed:
+        instance.image_variants = ""
+    if instance.pk is None:
+        return
+    # прежнее состояние поста читаем одним запросом
+    previous = (
+        Post.objects.filter(pk=instance.pk)
+        .values_list("author__username", "group__slug", "group_id", "image")
+        .first()
+    )
+    if previous is None:
+        return
+    username, group_slug, group_id, image = previous
+    # при переносе поста в другое сообщество сбрасываем и старую ленту
+    generations.bump(*generations.post_scopes(username, group_slug))
+    instance._previous_group_id = group_id
+    if image_changed:
+        # старую картинку освобождаем после сохранения поста
+        instance._replaced_image = image
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_stats(instance.author_id, "posts_count", 1)
+        counters.change_group_post_count(instance.group_id, 1)
+        timeline.fan_out(instance)
+    else:
+        previous_group_id = getattr(
+            instance, "_previous_group_id", instance.group_id
+        )
+        if previous_group_id != instance.group_id:
+            counters.change_group_post_count(previous_group_id, -1)
+            counters.change_group_post_count(instance.group_id, 1)
+    search.index_post(instance.pk)
+    terms.index_post(instance)
+    _bump_post(instance.pk)
+    if instance.image:
+        _schedule_thumbnails(instance.image.name)
+    replaced = getattr(instance, "_replaced_image", None)
+    if replaced and replaced != instance.image.name:
+        _release_image(replaced)
+    instance._replaced_image = None
+    instance._previous_group_id = instance.group_id
+
+
+def _release_image(name):
+    # проверка ссылок и удаление файлов после коммита,
+    # когда изменения постов уже видны
+    transaction.on_commit(lambda: thumbnails.release(name))
+
+
+def _schedule_thumbnails(name):
+    # миниатюры строятся после коммита, когда файл и пост уже сохранены,
+    # а затем schedule сбрасывает кеш лент, чтобы вместо оригинала
+    # в них попала миниатюра
+    transaction.on_commit(lambda: thumbnails.schedule(name))
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    # pre_delete всех удаляемых объектов приходит раньше post_delete
+    # комментариев, удаленных каскадом
+    deleting_posts.set(deleting_posts.get() | {instance.pk})
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts.set(deleting_posts.get() - {instance.pk})
+    if instance.image:
+        _release_image(instance.image.name)
+    search.remove_post(instance.pk)
+    counters.change_user_stats(instance.author_id, "posts_count", -1)
+    counters.change_group_post_count(instance.group_id, -1)
+    generations.bump(
+        *generations.post_scopes(
+            instance.author.username,
+            instance.group.slug if instance.group_id else None,
+        )
+    )
+
+
+@receiver(pre_save, sender=Group)
+def group_changing(sender, instance, **kwargs):
+    # прежний slug нужен, чтобы сбросить кеш страниц по старому адресу
+    instance._previous_slug = None
+    if instance.pk is not None:
+        instance._previous_slug = (
+            Group.objects.filter(pk=instance.pk)
+            .values_list("slug", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    # название сообщества входит в поисковые документы его постов
+    search.index_group(instance.pk)
+    # и в карточки постов во всех лентах, где они показаны
+    scopes = {"global", f"group:{instance.slug}"}
+    previous_slug = getattr(instance, "_previous_slug", None)
+    if previous_slug:
+        scopes.add(f"group:{previous_slug}")
+    usernames = (
+        Post.objects.filter(group=instance)
+        .values_list("author__username", flat=True)
+        .distinct()
+    )
+    scopes.update(f"author:{username}" for username in usernames)
+    generations.bump(*scopes)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_stats(instance.author_id, "followers_count", 1)
+        counters.change_user_stats(instance.user_id, "following_count", 1)
+        timeline.add_author(instance.user_id, instance.author_id)
+        _bump_users(instance.author_id, instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user_stats(instance.author_id, "followers_count", -1)
+    counters.change_user_stats(instance.user_id, "following_count", -1)
+    timeline.remove_author(instance.user_id, instance.author_id)
+    timeline.author_unfollowed(instance.author_id)
+    _bump_users(instance.author_id, instance.user_id)
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.files import locks
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+class HashingFile:
+    """
+    Обертка над загруженным файлом, которая считает sha256
+    по мере чтения кусков
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.digest = hashlib.sha256()
+
+    def chunks(self):
+        for chunk in self.content.chunks():
+            self.digest.update(chunk)
+            yield chunk
+
+
+def walk(storage, path):
+    """
+    Перебирает имена файлов в каталоге хранилища рекурсивно
+    в порядке сортировки по частям пути, чтобы обход можно было
+    продолжить с места остановки (см. posts/garbage.py)
+    """
+    directories, files = storage.listdir(path)
+    entries = [(name, False) for name in files]
+    entries.extend((name, True) for name in directories)
+    entries.sort()
+    for name, is_directory in entries:
+        if is_directory:
+            yield from walk(storage, os.path.join(path, name))
+        else:
+            yield os.path.join(path, name).replace("\\", "/")
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранит загруженные файлы по хешу содержимого: posts/ab/<sha256>.jpg.
+    Одинаковые картинки занимают на диске один файл, а миниатюры,
+    которые sorl и posts/variants.py строят по имени файла,
+    строятся для них один раз.
+    Файл удаляется, когда на него не ссылается ни один пост
+    (posts.thumbnails.release).
+
+    Повторная загрузка того же содержимого обновляет время изменения
+    файла, а release не удаляет недавно измененные файлы: пост новой
+    загрузки мог еще не закоммититься. Проверка и удаление в release
+    и запись в _save идут под блокировкой по хешу (locked), так что
+    файл не удаляется между обновлением времени и сохранением поста.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # совпадение имени означает совпадение содержимого,
+        # поэтому суффиксы к имени не добавляются
+        return name
+
+    @contextmanager
+    def locked(self, name):
+        """
+        Межпроцессная блокировка файла по хешу. Блокировки общие
+        для хешей с одинаковыми первыми двумя символами, чтобы файлов
+        блокировок было не больше 256.
+        """
+        digest = os.path.splitext(os.path.basename(name))[0]
+        directory = self.path(".locks")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{digest[:2]}.lock"), "a") as fp:
+            locks.lock(fp, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(fp)
+
+    def recently_modified(self, name, seconds):
+        try:
+            return time.time() - os.path.getmtime(self.path(name)) < seconds
+        except FileNotFoundError:
+            return False
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        # хеш считается в том же проходе, в котором файл пишется на диск
+        temporary = os.path.join(directory, f".upload-{uuid.uuid4().hex}")
+        hashing = HashingFile(content)
+        temporary = super()._save(temporary, hashing)
+        hexdigest = hashing.digest.hexdigest()
+        name = os.path.join(directory, hexdigest[:2], hexdigest + extension)
+        with self.locked(name):
+            if self.exists(name):
+                # файл снова нужен, release и сборщик мусора его не тронут
+                os.utime(self.path(name))
+                self.delete(temporary)
+            else:
+                os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+                os.replace(self.path(temporary), self.path(name))
+        return name.replace("\\", "/")
+
+
+post_image_storage = ContentAddressedStorage()
@@ -0,0 +1,216 @@
+import datetime as dt
+import io
+import random
+from collections import Counter
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
+
+from . import bulk
+from .models import Comment, Follow, Group, Post, User
+
+# Генератор синтетических данных для нагрузочных тестов и замеров.
+# Популярность авторов, сообществ и постов распределена по закону Ципфа:
+# вес элемента с рангом r равен 1 / r ** alpha, так что немногие авторы
+# собирают большую часть подписчиков, а немногие посты - большую часть
+# комментариев. Одинаковый seed дает одинаковые данные.
+
+WORDS = (
+    "утро вечер город море лес дорога дом кот пес книга музыка кофе "
+    "работа отпуск поезд снег дождь солнце друг семья код сервер база "
+    "запрос кеш лента подписка новость фото прогулка река гора парк "
+    "сегодня вчера снова очень тихо быстро долго красиво весело"
+).split()
+
+TAGS = ("котики", "путешествия", "python", "django", "еда", "спорт")
+
+# даты отсчитываются от фиксированного момента, а не от времени запуска,
+# иначе один и тот же seed давал бы разные данные
+EPOCH = dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def zipf_weights(count, alpha):
+    """
+    Накопленные веса рангов 1..count для random.choices(cum_weights=...)
+    """
+    return list(accumulate(1 / rank ** alpha for rank in range(1, count + 1)))
+
+
+def _insert(model, rows, batch_size, **options):
+    # вставляет объекты из генератора пачками, не держа их все в памяти
+    total = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return total
+        model.objects.bulk_create(batch, **options)
+        total += len(batch)
+
+
+def _new_pks(model, last_pk):
+    return list(
+        model.objects.filter(pk__gt=last_pk)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def _last_pk(model):
+    last = model.objects.order_by("-pk").values_list("pk", flat=True).first()
+    return last or 0
+
+
+def _past(rng, now, days):
+    return now - dt.timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+
+def _text(rng, usernames):
+    words = rng.choices(WORDS, k=rng.randint(5, 60))
+    if rng.random() < 0.2:
+        words.append(f"#{rng.choice(TAGS)}")
+    if usernames and rng.random() < 0.05:
+        words.append(f"@{rng.choice(usernames)}")
+    return " ".join(words).capitalize()
+
+
+def _make_images(rng, count):
+    """
+    Сохраняет count разных картинок и возвращает их имена в хранилище
+    """
+    storage = Post._meta.get_field("image").storage
+    names = []
+    for number in range(count):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        image = Image.new("RGB", (1280, 720), color)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+        names.append(
+            storage.save(
+                f"posts/synthetic-{number}.jpg",
+                ContentFile(buffer.getvalue()),
+            )
+        )
+    return names
+
+
+def generate(
+    seed=0,
+    users=1000,
+    groups=20,
+    posts=10000,
+    comments=3.0,
+    follows=10.0,
+    images=0,
+    image_ratio=0.3,
+    alpha=1.1,
+    days=365,
+    now=EPOCH,
+    password="12345",
+    batch_size=1000,
+):
+    """
+    Создает пользователей, сообщества, посты, комментарии (в среднем
+    comments на пост) и подписки (в среднем follows на пользователя),
+    затем собирает счетчики, ленты и индексы, как после import_data.
+    Даты публикаций разбросаны на days дней до now.
+    Возвращает Counter {модель: количество созданных}.
+    """
+    rng = random.Random(seed)
+    created = Counter()
+    fields = (
+        Post._meta.get_field("pub_date"),
+        Comment._meta.get_field("created"),
+    )
+    image_names = _make_images(rng, images)
+    # ленты на одних и тех же датах ничего не покажут,
+    # поэтому даты задаются явно
+    with transaction.atomic(), bulk.explicit_dates(*fields):
+        last_user = _last_pk(User)
+        # пароль одинаковый, хешируется один раз
+        hashed = make_password(password)
+        usernames = [f"user{seed}_{number}" for number in range(users)]
+        created["users"] = _insert(
+            User,
+            (
+                User(
+                    username=username,
+                    email=f"{username}@example.com",
+                    password=hashed,
+                )
+                for username in usernames
+            ),
+            batch_size,
+        )
+        user_pks = _new_pks(User, last_user)
+        # ранги популярности не совпадают с порядком регистрации
+        popular_users = rng.sample(user_pks, len(user_pks))
+        user_weights = zipf_weights(len(user_pks), alpha)
+
+        last_group = _last_pk(Group)
+        created["groups"] = _insert(
+            Group,
+            (
+                Group(
+                    title=f"Сообщество {seed}-{number}",
+                    slug=f"group-{seed}-{number}",
+                    description=_text(rng, None),
+                )
+                for number in range(groups)
+            ),
+            batch_size,
+        )
+        group_pks = _new_pks(Group, last_group)
+        group_weights = zipf_weights(len(group_pks), alpha)
+
+        def post_rows():
+            for _ in range(posts):
+                author = rng.choices(popular_users, cum_weights=user_weights)
+                group = None
+                # примерно каждый третий пост вне сообществ
+                if group_pks and rng.random() < 0.7:
+                    group = rng.choices(group_pks, cum_weights=group_weights)[0]
+                image = ""
+                if image_names and rng.random() < image_ratio:
+                    image = rng.choice(image_names)
+                yield Post(
+                    text=_text(rng, usernames),
+                    author_id=author[0],
+                    group_id=group,
+                    pub_date=_past(rng, now, days),
+                    image=image,
+                )
+
+        last_post = _last_pk(Post)
+        created["posts"] = _insert(Post, post_rows(), batch_size)
+        post_pks = _new_pks(Post, last_post)
+        popular_posts = rng.sample(post_pks, len(post_pks))
+        post_weights = zipf_weights(len(post_pks), alpha)
+
+        def comment_rows():
+            for _ in range(int(len(post_pks) * comments)):
+                post = rng.choices(popular_posts, cum_weights=post_weights)
+                yield Comment(
+                    post_id=post[0],
+                    author_id=rng.choice(user_pks),
+                    text=_text(rng, None),
+                    created=_past(rng, now, days),
+                )
+
+        created["comments"] = _insert(Comment, comment_rows(), batch_size)
+
+        def follow_rows():
+            for _ in range(int(len(user_pks) * follows)):
+                user = rng.choice(user_pks)
+                author = rng.choices(popular_users, cum_weights=user_weights)
+                if user != author[0]:
+                    yield Follow(user_id=user, author_id=author[0])
+
+        # повторные пары отбрасывает база
+        last_follow = _last_pk(Follow)
+        _insert(Follow, follow_rows(), batch_size, ignore_conflicts=True)
+        created["follows"] = Follow.objects.filter(pk__gt=last_follow).count()
+    bulk.finish_import()
+    return created
@@ -0,0 +1,70 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from yatube import metrics
+from yatube.cache import get_or_recompute
+
+# В template.Library зарегистрированы все теги и фильтры шаблонов
+# добавляем к ним тег кеширования лент
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, version, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.version = version
+        self.vary_on = vary_on
+
+    def render(self, context):
+        key = make_template_fragment_key(
+            self.fragment_name, [var.resolve(context) for var in self.vary_on]
+        )
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return self.nodelist.render(context)
+
+        content = get_or_recompute(
+            key,
+            compute,
+            version=self.version.resolve(context),
+            timeout=int(self.timeout.resolve(context)),
+        )
+        metrics.inc(
+            "yatube_feed_cache_total",
+            fragment=self.fragment_name,
+            result="miss" if computed else "hit",
+        )
+        return content
+
+
+@register.tag
+def feed_cache(parser, token):
+    """
+    Аналог {% cache %} для лент, защищенный от одновременного пересчета:
+
+        {% feed_cache timeout fragment_name version [var1] [var2] .. %}
+            .. лента ..
+        {% endfeed_cache %}
+
+    Версия (поколение ленты) хранится вместе с фрагментом, а не в ключе,
+    поэтому после смены версии фрагмент пересчитывает один процесс,
+    а остальные в это время отдают предыдущую копию.
+    """
+    nodelist = parser.parse(("endfeed_cache",))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 4:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' tag requires at least 3 arguments."
+        )
+    return FeedCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],  # как и в {% cache %}, имя фрагмента не переменная
+        parser.compile_filter(tokens[3]),
+        [parser.compile_filter(t) for t in tokens[4:]],
+    )
@@ -0,0 +1,30 @@
+from django import template
+
+from posts import variants
+from posts.thumbnails import cached_url
+
+# фильтр для вывода заранее построенных миниатюр (posts/thumbnails.py)
+register = template.Library()
+
+
+@register.filter
+def thumbnail_url(image, alias):
+    """
+    {{ post.image|thumbnail_url:"post_card" }} - адрес готовой миниатюры,
+    пока она строится - адрес оригинала
+    """
+    return cached_url(image, alias)
+
+
+@register.filter
+def image_srcset(post, fmt):
+    """
+    {{ post|image_srcset:"webp" }} - srcset из построенных вариантов
+    картинки в формате fmt, пустая строка, если их еще нет
+    """
+    if not post.image or not post.image_variants:
+        return ""
+    if fmt not in variants.formats():
+        return ""
+    widths = [int(width) for width in post.image_variants.split(",")]
+    return variants.srcset(post.image.name, widths, fmt)
@@ -0,0 +1,26 @@
+from django import template
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from posts.terms import TERM
+
+register = template.Library()
+
+
+def _link(match):
+    sign, name = match.groups()
+    if sign == "#":
+        url = reverse("tag_posts", args=[name.lower()])
+    else:
+        url = reverse("profile", args=[name])
+    return f'<a href="{url}">{sign}{name}</a>'
+
+
+@register.filter(is_safe=True)
+def linkify_terms(html):
+    """
+    {{ post.text|linebreaksbr|linkify_terms }} - делает #теги ссылками
+    на ленты тегов, а @упоминания - ссылками на профили.
+    Применяется к уже экранированному тексту.
+    """
+    return mark_safe(TERM.sub(_link, str(html)))
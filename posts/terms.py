@@ -0,0 +1,100 @@
+import re
+
+from django.core import mail
+from django.db import transaction
+from django.urls import reverse
+
+from .models import Post, PostTerm, User
+
+# хештег или упоминание начинается не внутри слова, не внутри адреса почты
+# и не внутри HTML-сущности вроде &#39; в уже экранированном тексте
+TERM = re.compile(r"(?<![\w@#&])([#@])(\w+)")
+
+TERM_LENGTH = PostTerm._meta.get_field("term").max_length
+
+
+def extract_terms(text):
+    """
+    Возвращает множество терминов текста: "#тег" и "@пользователь"
+    в нижнем регистре
+    """
+    return {
+        f"{sign}{name.lower()}"[:TERM_LENGTH]
+        for sign, name in TERM.findall(text or "")
+    }
+
+
+def index_post(post, notify=True):
+    """
+    Приводит записи PostTerm поста в соответствие с его текстом.
+    Новым упомянутым пользователям после коммита уходит письмо.
+    """
+    terms = extract_terms(post.text)
+    rows = PostTerm.objects.filter(post=post).values_list("term", "pub_date")
+    current = {term for term, _ in rows}
+    removed = current - terms
+    added = terms - current
+    if removed:
+        PostTerm.objects.filter(post=post, term__in=removed).delete()
+    if any(pub_date != post.pub_date for _, pub_date in rows):
+        # дата публикации поста изменилась, например, при импорте
+        PostTerm.objects.filter(post=post).update(pub_date=post.pub_date)
+    if added:
+        PostTerm.objects.bulk_create(
+            [
+                PostTerm(term=term, post=post, pub_date=post.pub_date)
+                for term in added
+            ],
+            ignore_conflicts=True,
+        )
+    mentioned = [term[1:] for term in added if term.startswith("@")]
+    if notify and mentioned:
+        transaction.on_commit(lambda: notify_mentioned(post, mentioned))
+
+
+def notify_mentioned(post, usernames):
+    users = (
+        User.objects.filter(username__in=usernames)
+        .exclude(pk=post.author_id)
+        .exclude(email="")
+    )
+    url = reverse("post", args=[post.author.username, post.pk])
+    messages = [
+        (
+            "Вас упомянули в записи",
+            f"{post.author.username} упомянул вас в записи: {url}",
+            "yatube@mail.ru",
+            [user.email],
+        )
+        for user in users
+    ]
+    if messages:
+        mail.send_mass_mail(messages, fail_silently=True)
+
+
+@transaction.atomic
+def rebuild_terms(batch_size=1000):
+    """
+    Заполняет индекс терминов заново по текстам постов, порциями
+    по batch_size постов, в одной транзакции, чтобы ленты тегов
+    не пустели на время пересборки. Возвращает количество записей индекса.
+    """
+    PostTerm.objects.all().delete()
+    total = 0
+    last_pk = 0
+    while True:
+        posts = list(
+            Post.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "text", "pub_date")[:batch_size]
+        )
+        if not posts:
+            return total
+        entries = [
+            PostTerm(term=term, post_id=pk, pub_date=pub_date)
+            for pk, text, pub_date in posts
+            for term in extract_terms(text)
+        ]
+        PostTerm.objects.bulk_create(entries, batch_size=batch_size)
+        total += len(entries)
+        last_pk = posts[-1][0]
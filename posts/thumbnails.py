@@ -0,0 +1,307 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as BaseKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from yatube import metrics
+
+from . import generations, variants
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Миниатюры и варианты картинок постов строятся заранее, в пуле потоков
+# после сохранения поста. Шаблоны только читают готовые адреса
+# и никогда не ресайзят оригинал во время запроса.
+
+_executor = None
+_executor_lock = threading.Lock()
+# картинки, миниатюры которых уже строятся, чтобы не ставить их дважды
+_in_progress = set()
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    """
+    Бэкенд sorl, который умеет искать готовую миниатюру, не создавая ее
+    """
+
+    def thumbnail_file(self, file_, geometry_string, options):
+        # имя миниатюры вычисляется так же, как в get_thumbnail
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault("format", self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """
+        Возвращает готовую миниатюру или None, если ее еще нет
+        """
+        if not file_:
+            return None
+        thumbnail = self.thumbnail_file(file_, geometry_string, options)
+        return default.kvstore.get(thumbnail)
+
+
+class KVStore(BaseKVStore):
+    """
+    Хранилище ключей sorl (кеш + таблица в базе), которое умеет
+    читать записи многих миниатюр за один запрос
+    """
+
+    def get_many(self, image_files):
+        """
+        Возвращает словарь {ключ миниатюры: ImageFile} для найденных
+        миниатюр: один get_many к кешу и один запрос к базе на промахи
+        """
+        keys = {
+            add_prefix(image_file.key): image_file.key
+            for image_file in image_files
+        }
+        values = self.cache.get_many(list(keys))
+        missing = [key for key in keys if key not in values]
+        if missing:
+            stored = dict(
+                KVStoreModel.objects.filter(key__in=missing).values_list(
+                    "key", "value"
+                )
+            )
+            # отсутствующие записи тоже кешируем, как это делает _get_raw
+            fetched = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(
+                fetched, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+            values.update(fetched)
+        return {
+            keys[key]: deserialize_image_file(value)
+            for key, value in values.items()
+            if value and value != EMPTY_VALUE
+        }
+
+    def delete_many(self, image_files):
+        """
+        Удаляет записи картинок и списки их миниатюр одним запросом
+        к базе и одним delete_many к кешу. Сами файлы не удаляются.
+        """
+        keys = [
+            add_prefix(image_file.key, identity)
+            for image_file in image_files
+            for identity in ("image", "thumbnails")
+        ]
+        if keys:
+            KVStoreModel.objects.filter(key__in=keys).delete()
+            self.cache.delete_many(keys)
+
+
+def _alias(name):
+    geometry, options = settings.POST_THUMBNAILS[name]
+    return geometry, dict(options)
+
+
+def cached_url(image, alias):
+    """
+    Адрес готовой миниатюры картинки. Пока миниатюра строится,
+    возвращается адрес оригинала.
+    """
+    if not image:
+        return ""
+    geometry, options = _alias(alias)
+    thumbnail = default.backend.get_cached_thumbnail(
+        image.name, geometry, **options
+    )
+    if thumbnail is not None:
+        return thumbnail.url
+    schedule(image.name)
+    return image.url
+
+
+def prefetch_thumbnails(posts):
+    """
+    Находит готовые миниатюры всех постов страницы одним обращением
+    к хранилищу ключей и сохраняет адреса в post.thumbnails[имя размера]
+    """
+    with_image = [post for post in posts if post.image]
+    wanted = []
+    for post in with_image:
+        post.thumbnails = {}
+        for alias in settings.POST_THUMBNAILS:
+            geometry, options = _alias(alias)
+            thumbnail = default.backend.thumbnail_file(
+                post.image.name, geometry, options
+            )
+            wanted.append((post, alias, thumbnail))
+    if not wanted:
+        return
+    found = default.kvstore.get_many(thumbnail for _, _, thumbnail in wanted)
+    missing = {}
+    for post, alias, thumbnail in wanted:
+        if thumbnail.key in found:
+            post.thumbnails[alias] = found[thumbnail.key].url
+        else:
+            # миниатюра еще строится или потеряна, выводим оригинал
+            post.thumbnails[alias] = post.image.url
+            missing[post.image.name] = None
+    if missing:
+        schedule_many(missing)
+
+
+def pregenerate(name):
+    """
+    Строит все миниатюры из POST_THUMBNAILS и варианты для srcset
+    для картинки с именем name
+    """
+    # та же картинка могла быть загружена раньше в другой пост
+    built = (
+        Post.objects.filter(image=name)
+        .exclude(image_variants="")
+        .values_list("image_variants", flat=True)
+        .first()
+    )
+    if built is None:
+        widths = variants.build_variants(name)
+        built = ",".join(str(width) for width in widths)
+    Post.objects.filter(image=name).update(image_variants=built)
+    for alias in settings.POST_THUMBNAILS:
+        geometry, options = _alias(alias)
+        default.backend.get_thumbnail(name, geometry, **options)
+
+
+def _failure_key(name):
+    return f"thumbnails:failed:{name}"
+
+
+def _run(name, on_done):
+    started = time.perf_counter()
+    try:
+        pregenerate(name)
+        metrics.observe(
+            "yatube_thumbnail_seconds", time.perf_counter() - started
+        )
+        if on_done is not None:
+            on_done()
+    except Exception:
+        # битая картинка не должна ронять воркер и остальные задачи,
+        # а отметка не дает лентам ставить ее в очередь на каждом показе
+        cache.set(
+            _failure_key(name), True, settings.POST_THUMBNAIL_RETRY_AFTER
+        )
+        metrics.inc("yatube_thumbnail_failures_total")
+        logger.exception("Не удалось построить миниатюры %s", name)
+    finally:
+        with _executor_lock:
+            _in_progress.discard(name)
+
+
+def _run_in_thread(name, on_done):
+    try:
+        _run(name, on_done)
+    finally:
+        # у каждого потока пула свое соединение с базой
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POST_THUMBNAIL_WORKERS,
+            thread_name_prefix="thumbnails",
+        )
+    return _executor
+
+
+def _bump_feeds(name):
+    # пока миниатюра строилась, ленты закешировали адрес оригинала
+    rows = (
+        Post.objects.filter(image=name)
+        .values_list("author__username", "group__slug")
+        .distinct()
+    )
+    scopes = {scope for row in rows for scope in generations.post_scopes(*row)}
+    if scopes:
+        generations.bump(*scopes)
+
+
+def schedule(name, on_done=None):
+    """
+    Ставит построение миниатюр картинки в очередь пула. on_done
+    вызывается после построения, по умолчанию сбрасывает кеш лент
+    с постами этой картинки. При POST_THUMBNAIL_WORKERS = 0 миниатюры
+    строятся сразу. Картинки, которые не удалось обработать, снова
+    ставятся в очередь только через POST_THUMBNAIL_RETRY_AFTER секунд.
+    """
+    if cache.get(_failure_key(name)) is None:
+        _submit(name, on_done)
+
+
+def schedule_many(names):
+    """
+    schedule для нескольких картинок: отметки неудач читаются
+    одним get_many
+    """
+    failed = cache.get_many([_failure_key(name) for name in names])
+    for name in names:
+        if _failure_key(name) not in failed:
+            _submit(name, None)
+
+
+def _submit(name, on_done):
+    if on_done is None:
+        on_done = partial(_bump_feeds, name)
+    with _executor_lock:
+        if name in _in_progress:
+            return
+        _in_progress.add(name)
+        executor = None
+        if settings.POST_THUMBNAIL_WORKERS > 0:
+            executor = _get_executor()
+    if executor is None:
+        _run(name, on_done)
+    else:
+        executor.submit(_run_in_thread, name, on_done)
+
+
+def release(name):
+    """
+    Удаляет картинку, ее миниатюры и варианты, если на нее
+    больше не ссылается ни один пост. Картинки, загруженные
+    за последние POST_IMAGE_RELEASE_GRACE секунд, остаются
+    сборщику мусора (collect_media_garbage): их мог взять пост,
+    который еще не закоммичен.
+    """
+    if not name:
+        return
+    storage = Post._meta.get_field("image").storage
+    try:
+        with storage.locked(name):
+            if storage.recently_modified(
+                name, settings.POST_IMAGE_RELEASE_GRACE
+            ) or Post.objects.filter(image=name).exists():
+                return
+            source = ImageFile(name, default.storage)
+            default.kvstore.delete(source, delete_thumbnails=True)
+            variants.delete_variants(name)
+            storage.delete(name)
+    except Exception:
+        # запрос, удаливший пост, из-за файлов падать не должен
+        logger.exception("Не удалось удалить картинку %s", name)
@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Post, Follow, TimelineEntry, UserStats
+
+# последние посты автора раскладываются по лентам всех его подписчиков
+# одним INSERT ... SELECT; записи, которые уже есть в ленте, пропускаются
+BACKFILL_SQL = (
+    f"INSERT INTO {TimelineEntry._meta.db_table} "
+    "(user_id, post_id, pub_date) "
+    "SELECT follow.user_id, post.id, post.pub_date "
+    f"FROM {Follow._meta.db_table} follow, "
+    f"(SELECT id, pub_date FROM {Post._meta.db_table} WHERE author_id = %s "
+    "ORDER BY pub_date DESC LIMIT %s) post "
+    "WHERE follow.author_id = %s "
+    "ON CONFLICT DO NOTHING"
+)
+
+
+def _is_celebrity(author_id):
+    # у популярных авторов посты не раскладываются по лентам подписчиков
+    return UserStats.objects.filter(
+        pk=author_id,
+        followers_count__gte=settings.TIMELINE_CELEBRITY_THRESHOLD,
+    ).exists()
+
+
+def _bulk_add(entries):
+    # размер пачки выбирает бэкенд: у SQLite он ограничен
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def fan_out(post, batch_size=1000):
+    """
+    Раскладывает новый пост по лентам подписчиков автора
+    """
+    if _is_celebrity(post.author_id):
+        return
+    followers = (
+        Follow.objects.filter(author=post.author_id)
+        .values_list("user_id", flat=True)
+        .iterator()
+    )
+    batch = []
+    for user_id in followers:
+        batch.append(
+            TimelineEntry(
+                user_id=user_id, post_id=post.pk, pub_date=post.pub_date
+            )
+        )
+        if len(batch) >= batch_size:
+            _bulk_add(batch)
+            batch = []
+    _bulk_add(batch)
+
+
+def add_author(user_id, author_id):
+    """
+    Добавляет в ленту пользователя последние посты автора,
+    на которого он подписался
+    """
+    if _is_celebrity(author_id):
+        return
+    posts = (
+        Post.objects.filter(author=author_id)
+        .order_by("-pub_date")
+        .values_list("pk", "pub_date")[: settings.TIMELINE_BACKFILL_SIZE]
+    )
+    _bulk_add(
+        [
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+        ]
+    )
+
+
+def remove_author(user_id, author_id):
+    """
+    Убирает из ленты пользователя посты автора, от которого он отписался
+    """
+    TimelineEntry.objects.filter(
+        user=user_id, post__author=author_id
+    ).delete()
+
+
+def _backfill_followers(cursor, author_id):
+    cursor.execute(
+        BACKFILL_SQL, [author_id, settings.TIMELINE_BACKFILL_SIZE, author_id]
+    )
+
+
+def author_unfollowed(author_id):
+    # автор перестал быть популярным: его посты больше не подтягиваются
+    # при чтении, поэтому раскладываем последние из них по лентам
+    followers_count = (
+        UserStats.objects.filter(pk=author_id)
+        .values_list("followers_count", flat=True)
+        .first()
+    )
+    if followers_count != settings.TIMELINE_CELEBRITY_THRESHOLD - 1:
+        return
+    # один запрос на всех подписчиков, а не по запросу на каждого
+    with connection.cursor() as cursor:
+        _backfill_followers(cursor, author_id)
+
+
+def timeline(user):
+    """
+    Источники ленты подписок пользователя: предрассчитанные записи
+    TimelineEntry и посты популярных авторов, которые подтягиваются
+    при чтении (None, если таких авторов нет). Оба читаются по индексам
+    (pub_date, id), см. KeysetPaginator(merge=...).
+    """
+    entries = TimelineEntry.objects.select_related(
+        "post__author", "post__group"
+    ).filter(user=user)
+    celebrities = list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gte=(
+                settings.TIMELINE_CELEBRITY_THRESHOLD
+            ),
+        ).values_list("author_id", flat=True)
+    )
+    if not celebrities:
+        return entries, None
+    posts = Post.objects.select_related("author", "group").filter(
+        author_id__in=celebrities
+    )
+    return entries, posts
+
+
+@transaction.atomic
+def rebuild_timelines():
+    """
+    Собирает ленты подписок заново по таблицам подписок и постов:
+    последние посты каждого автора раскладываются по лентам всех его
+    подписчиков (BACKFILL_SQL). Пересборка идет в одной транзакции,
+    чтобы ленты не пустели на это время. Возвращает количество подписок.
+    """
+    TimelineEntry.objects.all().delete()
+    celebrities = set(
+        UserStats.objects.filter(
+            followers_count__gte=settings.TIMELINE_CELEBRITY_THRESHOLD
+        ).values_list("pk", flat=True)
+    )
+    authors = (
+        Follow.objects.order_by("author_id")
+        .values_list("author_id", flat=True)
+        .distinct()
+    )
+    with connection.cursor() as cursor:
+        for author_id in list(authors):
+            if author_id not in celebrities:
+                _backfill_followers(cursor, author_id)
+    return Follow.objects.count()
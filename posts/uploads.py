@@ -0,0 +1,128 @@
+import io
+import os
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, ImageOps
+
+# Загрузка картинок постов с ограниченным расходом памяти и процессора:
+# лишние байты отбрасываются еще при чтении запроса, разрешение
+# проверяется по заголовку файла без декодирования, а принятая картинка
+# перекодируется без EXIF и с ограниченным размером.
+
+# форматы, которые можно перекодировать без потери анимации и прозрачности
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+
+# прозрачный GIF 1x1
+PLACEHOLDER = (
+    b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!"
+    b"\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01"
+    b"\x00\x00\x02\x02D\x01\x00;"
+)
+
+
+class OversizeUploadedFile(UploadedFile):
+    """
+    Заглушка вместо файла, превысившего POST_IMAGE_MAX_SIZE: содержимое
+    отброшено, известен только размер. Внутри крошечная картинка, чтобы
+    стандартная проверка поля пропустила файл до clean_image,
+    где по размеру выдается понятная ошибка.
+    """
+
+    def __init__(self, name, content_type, size):
+        super().__init__(io.BytesIO(PLACEHOLDER), name, content_type, size)
+
+
+class BoundedUploadHandler(FileUploadHandler):
+    """
+    Обработчик загрузок форм постов, декоратор bounded_uploads ставит
+    его первым. Пропускает куски файла следующим обработчикам, пока файл
+    не превысит POST_IMAGE_MAX_SIZE, а дальше отбрасывает их, так что
+    ни память, ни временный файл не растут сверх лимита.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversize = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_SIZE:
+            self.oversize = True
+        if self.oversize:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.oversize:
+            # файл собирают следующие обработчики
+            return None
+        return OversizeUploadedFile(
+            self.file_name, self.content_type, file_size
+        )
+
+
+def _resolution_error(width, height):
+    return forms.ValidationError(
+        message=f"Разрешение изображения {width}x{height} слишком большое. "
+        f"Допускается не более "
+        f"{settings.POST_IMAGE_MAX_PIXELS // 10 ** 6} мегапикселей",
+    )
+
+
+def check_image_header(file):
+    """
+    Проверяет разрешение картинки по заголовку: Image.open читает только
+    заголовок, поэтому «бомба» из огромного сжатого холста не декодируется
+    """
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except Image.DecompressionBombError:
+        raise _resolution_error("?", "?")
+    except (OSError, SyntaxError):
+        # ошибку «не изображение» выдаст стандартная проверка поля
+        return
+    finally:
+        file.seek(0)
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise _resolution_error(width, height)
+
+
+def normalize_image(file):
+    """
+    Перекодирует загруженную картинку: поворачивает по EXIF и удаляет его,
+    уменьшает до POST_IMAGE_MAX_DIMENSION по большей стороне.
+    Анимированные и нестандартные форматы остаются как есть.
+    """
+    file.seek(0)
+    image = Image.open(file)
+    animated = getattr(image, "is_animated", False)
+    if image.format not in EXTENSIONS or animated:
+        file.seek(0)
+        return file
+    fmt = image.format
+    image = ImageOps.exif_transpose(image)
+    if fmt == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    limit = settings.POST_IMAGE_MAX_DIMENSION
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    buffer = io.BytesIO()
+    # без параметра exif Pillow метаданные не сохраняет
+    image.save(buffer, format=fmt, quality=settings.POST_UPLOAD_QUALITY)
+    size = buffer.tell()
+    buffer.seek(0)
+    name = f"{os.path.splitext(file.name)[0]}.{EXTENSIONS[fmt]}"
+    return InMemoryUploadedFile(
+        buffer,
+        getattr(file, "field_name", "image"),
+        name,
+        Image.MIME[fmt],
+        size,
+        None,
+    )
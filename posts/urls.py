@@ -6,6 +6,10 @@ urlpatterns = [
     path("follow/", views.follow_index, name="follow_index"),
     # создание нового поста
     path("new/", views.new_post, name="new_post"),
+    # поиск по записям
+    path("search/", views.search, name="search"),
+    # посты с хештегом
+    path("tag/<str:name>/", views.tag_posts, name="tag_posts"),
     # вывод всех постов группы
     path("group/<slug>/", views.group_posts, name="group_posts"),
     # Профайл пользователя
@@ -1,13 +1,14 @@
 from django import forms
+from django.conf import settings
 
 
 def validate_file_size(image):
     # устанавливаем максимальный размер для загружаемого на сайт файла
     filesize = image.size
-    if filesize > 5242880:
+    if filesize > settings.POST_IMAGE_MAX_SIZE:
         raise forms.ValidationError(
             message=f"Размер загружаемого файла составляет {round(filesize / (1024 * 1024), 1)} Мбайт.\
-                     Максимальный размер изображения не должен превышать  5 Мбайт",
+                     Максимальный размер изображения не должен превышать  {settings.POST_IMAGE_MAX_SIZE // (1024 * 1024)} Мбайт",
         )
     else:
         return image
@@ -0,0 +1,78 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+# Варианты картинки поста для srcset: несколько ширин в каждом формате.
+# Имена вычисляются из имени оригинала, поэтому шаблону достаточно
+# знать список построенных ширин (Post.image_variants).
+
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+def formats():
+    # без собранной поддержки WebP в Pillow остается только JPEG
+    return [
+        fmt
+        for fmt in settings.POST_IMAGE_FORMATS
+        if fmt != "webp" or features.check("webp")
+    ]
+
+
+def variant_name(name, width, fmt):
+    stem = os.path.splitext(name)[0]
+    return f"variants/{stem}-{width}w.{EXTENSIONS[fmt]}"
+
+
+def srcset(name, widths, fmt):
+    """
+    Значение атрибута srcset для построенных вариантов картинки
+    """
+    return ", ".join(
+        f"{default_storage.url(variant_name(name, width, fmt))} {width}w"
+        for width in widths
+    )
+
+
+def _save(name, image, fmt):
+    buffer = io.BytesIO()
+    image.save(
+        buffer, format=fmt.upper(), quality=settings.POST_IMAGE_QUALITY
+    )
+    # имя должно остаться тем же, поэтому старый файл удаляем,
+    # иначе хранилище добавит к имени случайный суффикс
+    default_storage.delete(name)
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_variants(name):
+    """
+    Строит варианты картинки из одного декодирования оригинала.
+    Возвращает список построенных ширин.
+    """
+    with default_storage.open(name) as source:
+        original = Image.open(source)
+        original.load()
+    original = ImageOps.exif_transpose(original).convert("RGB")
+    ratio_w, ratio_h = settings.POST_IMAGE_ASPECT
+    widths = []
+    for width in sorted(settings.POST_IMAGE_WIDTHS):
+        # ширины больше оригинала только добавляют байт,
+        # самую маленькую строим всегда
+        if widths and width > original.width:
+            break
+        size = (width, round(width * ratio_h / ratio_w))
+        image = ImageOps.fit(original, size, Image.LANCZOS)
+        for fmt in formats():
+            _save(variant_name(name, width, fmt), image, fmt)
+        widths.append(width)
+    return widths
+
+
+def delete_variants(name):
+    for width in settings.POST_IMAGE_WIDTHS:
+        for fmt in EXTENSIONS:
+            default_storage.delete(variant_name(name, width, fmt))
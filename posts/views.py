@@ -1,34 +1,40 @@
+from operator import attrgetter
+
 # from django.http import HttpResponse
 from django.shortcuts import (
     render,
     redirect,
     get_object_or_404,
-    get_list_or_404,
 )
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import requires_csrf_token
 # from django.views.decorators.cache import cache_page
-from django.db.models import Count
-from django.core.paginator import Paginator
+from django.db import transaction
 
-from .models import Post, Group, User, Comment, Follow
+from .models import Post, Group, User, Comment, Follow, PostTerm
 from .forms import PostForm, CommentForm
+from .paginator import KeysetPaginator
+from .counters import get_user_stats
+from .timeline import timeline
+from .generations import feed_cache_context
+from .decorators import bounded_uploads, cached_page
+from .thumbnails import prefetch_thumbnails
+from .search import SearchPage
 
 
+@cached_page(lambda: ["global"])
 def index(request):
     # главная страница
     post_list = (
         Post.objects.select_related("author", "group")
         .order_by("-pub_date")
         .all()
-        .annotate(comment_count=Count("comment_post"))
     )
     # показывать по 10 записей на странице.
-    paginator = Paginator(post_list, 10)
-    # переменная в URL с номером запрошенной страницы
-    page_number = request.GET.get("page")
-    # получить записи с нужным смещением
-    page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(post_list, 10, prefetch=prefetch_thumbnails)
+    # курсоры ?after=/?before= в URL указывают позицию в ленте,
+    # записи выбираются по индексу pub_date без OFFSET и COUNT(*)
+    page = paginator.get_page_from_request(request)
     if request.user.is_authenticated:
         # узнаем, подписан ли на кого-то залогиненный пользователь
         follow = Follow.objects.filter(user=request.user).exists()
@@ -40,6 +46,7 @@ def index(request):
                 "page": page,
                 "paginator": paginator,
                 "follow": follow,
+                **feed_cache_context("global"),
             },
         )
     # если не залогинен, меню не отображается, follow передаем,
@@ -47,10 +54,16 @@ def index(request):
     return render(
         request,
         "index.html",
-        {"page": page, "paginator": paginator, "follow": False},
+        {
+            "page": page,
+            "paginator": paginator,
+            "follow": False,
+            **feed_cache_context("global"),
+        },
     )
 
 
+@cached_page(lambda slug: [f"group:{slug}"])
 def group_posts(request, slug):
     # все посты выбранной группы
     group = get_object_or_404(Group, slug=slug)
@@ -61,19 +74,61 @@ def group_posts(request, slug):
         .all()
     )
     # показывать по 10 записей на странице.
-    paginator = Paginator(post_list, 10)
-    # переменная в URL с номером запрошенной страницы
-    page_number = request.GET.get("page")
-    # получить записи с нужным смещением
-    page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(post_list, 10, prefetch=prefetch_thumbnails)
+    # курсоры ?after=/?before= в URL указывают позицию в ленте,
+    # записи выбираются по индексу (group, pub_date) без OFFSET и COUNT(*)
+    page = paginator.get_page_from_request(request)
     return render(
         request,
         "group.html",
-        {"group": group, "page": page, "paginator": paginator},
+        {
+            "group": group,
+            "page": page,
+            "paginator": paginator,
+            **feed_cache_context(f"group:{group.slug}"),
+        },
+    )
+
+
+@cached_page(lambda name: ["global"])
+def tag_posts(request, name):
+    # посты с хештегом #name читаются по индексу терминов PostTerm
+    # (term, pub_date, post) сразу в порядке публикации
+    entries = PostTerm.objects.select_related(
+        "post__author", "post__group"
+    ).filter(term=f"#{name.lower()}")
+    paginator = KeysetPaginator(
+        entries,
+        10,
+        prefetch=prefetch_thumbnails,
+        id_field="post_id",
+        item=attrgetter("post"),
+    )
+    page = paginator.get_page_from_request(request)
+    return render(
+        request,
+        "tag.html",
+        {
+            "tag": name.lower(),
+            "page": page,
+            "paginator": paginator,
+            **feed_cache_context("global"),
+        },
     )
 
 
+def search(request):
+    # полнотекстовый поиск по постам, сообществам и комментариям,
+    # результаты идут по убыванию релевантности
+    query = request.GET.get("q", "").strip()
+    page = SearchPage(
+        query, 10, after=request.GET.get("after"), prefetch=prefetch_thumbnails
+    )
+    return render(request, "search.html", {"query": query, "page": page})
+
+
 @login_required
+@bounded_uploads
 def new_post(request):
     # Создание нового поста
     if request.method == "POST":
@@ -81,58 +136,60 @@ def new_post(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            # пост и счетчик записей автора сохраняются вместе
+            with transaction.atomic():
+                post.save()
             return redirect("index")
     else:
         form = PostForm(request.POST or None)
     return render(request, "new_post.html", {"form": form})
 
 
+@cached_page(lambda username: [f"author:{username}"])
 def profile(request, username):
     # Страница профиля зарегистрированного пользователя.
     # Содержит данные о пользователе и его посты.
-    profile = get_object_or_404(User, username=username)
+    # счетчики пользователя приходят тем же запросом через select_related
+    profile = get_object_or_404(
+        User.objects.select_related("stats"), username=username
+    )
     post_list = (
         Post.objects.select_related("author", "group")
         .filter(author=profile)
         .order_by("-pub_date")
         .all()
-        .annotate(comment_count=Count("comment_post"))
     )
-    posts_count = post_list.count()
-    paginator = Paginator(post_list, 5)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(post_list, 5, prefetch=prefetch_thumbnails)
+    page = paginator.get_page_from_request(request)
+    stats = get_user_stats(profile)
     # проверка, подписан ли текущий пользователь на просматриваемого автора
-    follow = Follow.objects.filter(author=profile)
-    following_count = Follow.objects.filter(
-        author=profile
-    ).count()  # подписчики
-    follower_count = Follow.objects.filter(user=profile).count()  # подписан
-    following = False  # флаг, чтобы подписаться на автора
-    if following_count:
-        for item in follow:
-            if request.user == item.user:
-                following = True  # флаг, чтобы отписаться от автора
-                break
+    following = False
+    if request.user.is_authenticated and stats.followers_count > 0:
+        following = Follow.objects.filter(
+            author=profile, user=request.user
+        ).exists()
     return render(
         request,
         "profile.html",
         {
             "profile": profile,
-            "posts_count": posts_count,
+            "posts_count": stats.posts_count,
             "page": page,
             "paginator": paginator,
             "following": following,
-            "following_count": following_count,
-            "follower_count": follower_count,
+            "following_count": stats.followers_count,  # подписчики
+            "follower_count": stats.following_count,  # подписан
+            **feed_cache_context(f"author:{profile.username}"),
         },
     )
 
 
+@cached_page(lambda username, post_id, form=None: [f"author:{username}"])
 def post_view(request, username, post_id, form=None):
     # Страница просмотра выбранного поста.
-    profile = get_object_or_404(User, username=username)
+    profile = get_object_or_404(
+        User.objects.select_related("stats"), username=username
+    )
     post = get_object_or_404(Post, id=post_id)
     # добавляем форму для комментирования
     # проверям, что форма может быть уже заполнена комментарием,
@@ -141,19 +198,10 @@ def post_view(request, username, post_id, form=None):
         form = CommentForm(request.POST or None)
     # комментарии к посту
     items = Comment.objects.select_related("post", "author").filter(post=post)
-    # счетчики подписки на авторов
-    following_count = Follow.objects.filter(
-        author=profile
-    ).count()  # подписчики
-    follower_count = Follow.objects.filter(user=profile).count()  # подписан
     # проверка на соответствие id поста выбранному автору
-    if post.author == profile:
-        post.count = (
-            Post.objects.select_related("author", "group")
-            .filter(author=profile)
-            .count()
-        )
-        post.comment_count = items.count()
+    if post.author_id == profile.pk:
+        # счетчики подписки и записей автора
+        stats = get_user_stats(profile)
         return render(
             request,
             "post.html",
@@ -162,13 +210,15 @@ def post_view(request, username, post_id, form=None):
                 "post": post,
                 "items": items,
                 "form": form,
-                "following_count": following_count,
-                "follower_count": follower_count,
+                "posts_count": stats.posts_count,
+                "following_count": stats.followers_count,  # подписчики
+                "follower_count": stats.following_count,  # подписан
             },
         )
     return redirect("profile", username=profile.username)
 
 
+@bounded_uploads
 def post_edit(request, username, post_id):
     # Редактирование поста
     post = get_object_or_404(Post, id=post_id)
@@ -237,7 +287,9 @@ def add_comment(request, username, post_id):
             comment = form.save(commit=False)
             comment.author = request.user
             comment.post = post
-            comment.save()
+            # комментарий и счетчик комментариев поста сохраняются вместе
+            with transaction.atomic():
+                comment.save()
             return redirect("post", username=username, post_id=post_id)
     else:
         form = CommentForm(request.POST or None)
@@ -258,52 +310,53 @@ def follow_index(request):
                 author__in=author_list).order_by("-pub_date").all().annotate(
                 comment_count = Count('comment_post'))
     """
-    # этот вариант создания списка постов приводит к меньшему количеству
-    # обращений к базе данных
-    post_list = (
-        Post.objects.select_related("author", "group")
-        .filter(author__following__user=request.user)
-        .order_by("-pub_date")
-        .all()
-        .annotate(comment_count=Count("comment_post"))
-    )
+    # лента собирается из предрассчитанных записей (posts/timeline.py),
+    # посты популярных авторов подтягиваются при чтении и вливаются
+    # в страницу по тому же ключу (pub_date, id)
+    entries, celebrity_posts = timeline(request.user)
     # показывать по 10 записей на странице.
-    paginator = Paginator(post_list, 10)
-    # переменная в URL с номером запрошенной страницы
-    page_number = request.GET.get("page")
-    # получить записи с нужным смещением
-    page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(
+        entries,
+        10,
+        prefetch=prefetch_thumbnails,
+        id_field="post_id",
+        item=attrgetter("post"),
+        merge=celebrity_posts,
+    )
+    # курсоры ?after=/?before= в URL указывают позицию в ленте,
+    # записи выбираются по индексу (user, pub_date) без OFFSET и COUNT(*)
+    page = paginator.get_page_from_request(request)
     return render(
-        request, "follow.html", {"page": page, "paginator": paginator}
+        request,
+        "follow.html",
+        {
+            "page": page,
+            "paginator": paginator,
+            # лента подписок меняется с любым постом и с подписками читателя
+            **feed_cache_context(
+                "global", f"author:{request.user.username}"
+            ),
+        },
     )
 
 
 @login_required
 def profile_follow(request, username):
-    # проверка, что пользователь еще не подписан на выбранного автора
-    follow = Follow.objects.filter(user=request.user)
-    for item in follow:
-        if item.author.username == username:
-            return redirect("profile", username=username)
-            break
     # проверка, что автор сам на себя не подпишется (сделал дополнительно,
     # так как, если автор совпадает с текущим пользователем, то кнопка подписки
     # не отображается на странице. Стоит условие в шаблоне)
     if request.user.username != username:
-        # создание новой записи
-        author = User.objects.get(username=username)
-        user = User.objects.get(username=request.user.username)
-        Follow.objects.create(author=author, user=user)
+        author = get_object_or_404(User, username=username)
+        # подписка и счетчики обоих пользователей сохраняются вместе,
+        # повторная подписка ничего не меняет
+        with transaction.atomic():
+            Follow.objects.get_or_create(author=author, user=request.user)
     return redirect("profile", username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    # отписываемся от автора
+    # отписываемся от автора; сигналы удаления обновляют счетчики
     author = get_object_or_404(User, username=username)
-    unfollow = get_list_or_404(Follow, author=author)
-    for item in unfollow:
-        if item.user == request.user:
-            item.delete()
-            break
+    Follow.objects.filter(author=author, user=request.user).delete()
     return redirect("profile", username=username)
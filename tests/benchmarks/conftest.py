@@ -0,0 +1,124 @@
+import json
+import os
+
+import pytest
+
+# Замеры представлений на сгенерированных данных. Запускаются только
+# по требованию, т. к. генерация данных и повторные запросы небыстрые:
+#     BENCHMARK=1 pytest tests/benchmarks
+# Объем данных задается переменными BENCHMARK_USERS, BENCHMARK_POSTS
+# и т. д., см. DATASET.
+
+DATASET = {
+    "seed": int(os.environ.get("BENCHMARK_SEED", 1)),
+    "users": int(os.environ.get("BENCHMARK_USERS", 2000)),
+    "groups": int(os.environ.get("BENCHMARK_GROUPS", 50)),
+    "posts": int(os.environ.get("BENCHMARK_POSTS", 20000)),
+    "comments": float(os.environ.get("BENCHMARK_COMMENTS", 3)),
+    "follows": float(os.environ.get("BENCHMARK_FOLLOWS", 10)),
+    "images": int(os.environ.get("BENCHMARK_IMAGES", 0)),
+}
+
+HERE = os.path.dirname(__file__)
+RESULTS = os.environ.get("BENCHMARK_RESULTS", "benchmark.json")
+BASELINE = os.environ.get(
+    "BENCHMARK_BASELINE", os.path.join(HERE, "baseline.json")
+)
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("BENCHMARK"):
+        return
+    skip = pytest.mark.skip(reason="замеры запускаются с BENCHMARK=1")
+    for item in items:
+        if item.nodeid.startswith("tests/benchmarks/"):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def dataset(django_db_setup, django_db_blocker):
+    """
+    Сгенерированные данные и «типичные» объекты для адресов представлений
+    """
+    from posts import synthetic
+    from posts.models import Follow, Group, Post, PostTerm, User
+
+    with django_db_blocker.unblock():
+        synthetic.generate(**DATASET)
+        # самые нагруженные объекты: у них длиннее ленты и больше связей
+        author = User.objects.order_by("-stats__posts_count", "pk").first()
+        reader = User.objects.order_by("-stats__following_count", "pk").first()
+        post = (
+            Post.objects.filter(author=author)
+            .order_by("-comment_count", "pk")
+            .first()
+        )
+        group = Group.objects.order_by("-post_count", "pk").first()
+        tag = (
+            PostTerm.objects.filter(term__startswith="#")
+            .values_list("term", flat=True)
+            .first()
+        )
+        Follow.objects.get_or_create(user=reader, author=author)
+    return {
+        "author": author,
+        "reader": reader,
+        "post": post,
+        "group": group,
+        "tag": tag[1:] if tag else "котики",
+    }
+
+
+# результаты сессии для отчета в pytest_terminal_summary
+REPORT = {}
+
+
+def pytest_terminal_summary(terminalreporter):
+    # время зависит от машины, поэтому не проверяется, а только
+    # выводится, рядом с эталоном, если он сохранен
+    if not REPORT.get("views"):
+        return
+    baseline = REPORT["baseline"]
+    terminalreporter.write_sep("-", "время представлений, мс")
+    for name, result in sorted(REPORT["views"].items()):
+        line = (
+            f"{name:<18} запросов {result['queries']:>3}  "
+            f"sql {result['sql_ms']:>8}  p50 {result['p50_ms']:>8}  "
+            f"p95 {result['p95_ms']:>8}"
+        )
+        if name in baseline:
+            line += f"  (эталон p95 {baseline[name]['p95_ms']})"
+        terminalreporter.write_line(line)
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(baseline):
+    """
+    Результаты всех замеров; в конце сессии выводятся в отчет и пишутся
+    в BENCHMARK_RESULTS, а с BENCHMARK_UPDATE_BASELINE=1 сохраняются
+    как новый эталон
+    """
+    results = {"dataset": DATASET, "views": {}}
+    REPORT.update(views=results["views"], baseline=baseline)
+    yield results
+    if not results["views"]:
+        return
+    with open(RESULTS, "w", encoding="utf-8") as out:
+        json.dump(results, out, ensure_ascii=False, indent=2)
+    if os.environ.get("BENCHMARK_UPDATE_BASELINE"):
+        with open(BASELINE, "w", encoding="utf-8") as out:
+            json.dump(results, out, ensure_ascii=False, indent=2)
+
+
+@pytest.fixture(scope="session")
+def budgets():
+    with open(os.path.join(HERE, "budgets.json"), encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+@pytest.fixture(scope="session")
+def baseline():
+    if not os.path.exists(BASELINE):
+        return {}
+    with open(BASELINE, encoding="utf-8") as fp:
+        return json.load(fp)["views"]
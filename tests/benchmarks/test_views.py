@@ -0,0 +1,160 @@
+import os
+import time
+
+import pytest
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.urls import reverse
+
+import posts.urls
+import users.urls
+
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", 20))
+
+
+def _post_kwargs(data):
+    return {"username": data["author"].username, "post_id": data["post"].pk}
+
+
+# имя адреса: (метод, кто залогинен, аргументы адреса, данные формы).
+# Изменяющие запросы выполняются в транзакции, которая откатывается,
+# так что каждый повтор видит одни и те же данные.
+CASES = {
+    "index": ("get", None, None, None),
+    "follow_index": ("get", "reader", None, None),
+    "new_post": ("get", "reader", None, None),
+    "search": ("get", None, None, {"q": "кот"}),
+    "tag_posts": ("get", None, lambda data: {"name": data["tag"]}, None),
+    "group_posts": (
+        "get",
+        None,
+        lambda data: {"slug": data["group"].slug},
+        None,
+    ),
+    "profile": (
+        "get",
+        "reader",
+        lambda data: {"username": data["author"].username},
+        None,
+    ),
+    "post": ("get", "reader", _post_kwargs, None),
+    "post_edit": ("get", "author", _post_kwargs, None),
+    "post_confirm": ("get", "author", _post_kwargs, None),
+    "post_delete": ("get", "author", _post_kwargs, None),
+    "add_comment": ("post", "reader", _post_kwargs, {"text": "Замер"}),
+    "profile_follow": (
+        "get",
+        "reader",
+        lambda data: {"username": data["author"].username},
+        None,
+    ),
+    "profile_unfollow": (
+        "get",
+        "reader",
+        lambda data: {"username": data["author"].username},
+        None,
+    ),
+    "signup": ("get", None, None, None),
+}
+
+
+def _url_names():
+    return [
+        pattern.name
+        for module in (posts.urls, users.urls)
+        for pattern in module.urlpatterns
+    ]
+
+
+def percentile(values, share):
+    # по ближайшему рангу: значение, не меньше которого доля share замеров
+    ordered = sorted(values)
+    rank = max(1, round(share * len(ordered)))
+    return ordered[rank - 1]
+
+
+class QueryTimer:
+    """
+    Обертка выполнения SQL: считает запросы и их суммарное время
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def measure(client, method, url, data):
+    """
+    Повторяет запрос ITERATIONS раз с пустым кешем и возвращает
+    статус, количество запросов к базе, время SQL и p50/p95.
+    Первый, прогревочный запрос (загрузка шаблонов) не учитывается.
+    """
+    durations = []
+    sql = []
+    counts = []
+    for iteration in range(ITERATIONS + 1):
+        cache.clear()
+        timer = QueryTimer()
+        with transaction.atomic():
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                durations.append(time.perf_counter() - started)
+            transaction.set_rollback(True)
+        if not iteration:
+            continue
+        counts.append(timer.count)
+        sql.append(timer.seconds)
+    return {
+        "url": url,
+        "status": response.status_code,
+        "queries": max(counts),
+        "sql_ms": round(1000 * sum(sql) / len(sql), 2),
+        "p50_ms": round(1000 * percentile(durations, 0.5), 2),
+        "p95_ms": round(1000 * percentile(durations, 0.95), 2),
+    }
+
+
+class TestViewBenchmarks:
+    def test_every_view_measured(self):
+        missing = set(_url_names()) - set(CASES)
+        assert not missing, (
+            f"Добавьте замеры представлений {sorted(missing)} "
+            "в tests/benchmarks/test_views.py и budgets.json"
+        )
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize("name", sorted(CASES))
+    def test_view(
+        self, name, client, dataset, benchmark_results, budgets, baseline
+    ):
+        method, user, kwargs, data = CASES[name]
+        if user is not None:
+            client.force_login(dataset[user])
+        url = reverse(name, kwargs=kwargs(dataset) if kwargs else None)
+        result = measure(client, method, url, data)
+        benchmark_results["views"][name] = result
+
+        assert result["status"] < 400, f"{url} вернул {result['status']}"
+        assert name in budgets, f"Нет бюджета для {name} в budgets.json"
+        budget = budgets[name]
+        # проверяется только количество запросов: оно не зависит
+        # от машины, а время печатается в отчете для сравнения
+        assert result["queries"] <= budget["queries"], (
+            f"{name}: {result['queries']} запросов к базе "
+            f"при бюджете {budget['queries']}"
+        )
+        if name in baseline:
+            previous = baseline[name]
+            assert result["queries"] <= previous["queries"], (
+                f"{name}: запросов к базе стало {result['queries']}, "
+                f"в эталоне {previous['queries']}"
+            )
@@ -1,4 +1,16 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # база между тестами очищается без сигналов, поэтому закешированные
+    # страницы и поколения лент не должны переходить в следующий тест
+    from django.core.cache import cache
+    cache.clear()
+    yield
+    cache.clear()
@@ -1,4 +1,5 @@
 from yatube.settings import * # noqa
+from yatube.settings import LOGGING
 
 DATABASES = {
     'default': {
@@ -9,3 +10,25 @@ DATABASES = {
 
 # disable captcha during testing(you must manually set True)
 CAPTCHA_TEST_MODE = True
+
+# кеш в памяти процесса, чтобы тесты не писали в общий файловый кеш
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# миниатюры строятся сразу, без пула потоков
+POST_THUMBNAIL_WORKERS = 0
+
+# строки замеров запросов в выводе тестов не нужны
+LOGGING['loggers']['yatube.requests']['level'] = 'WARNING'
+
+# метрики только в памяти процесса
+METRICS_DIR = None
+
+# повторные запросы N+1 в тестах считаются ошибкой
+NPLUSONE_RAISE = True
+# при POST_THUMBNAIL_WORKERS = 0 миниатюры строятся прямо в запросе,
+# по несколько запросов на картинку, в продакшене это делает пул
+NPLUSONE_IGNORE = [r'"thumbnail_kvstore"', r'"image_variants"']
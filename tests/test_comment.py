@@ -99,3 +99,25 @@ class TestComment:
 #            'Проверьте, что вы создаёте новый комментарий `/<username>/<post_id>/comment/`'
 #        assert response.url.startswith(f'/{post.author.username}/{post.id}'), \
 #            'Проверьте, что перенаправляете на страницу поста `/<username>/<post_id>/` после добавления нового комментария'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_comment_count(self, user, post):
+        from django.core.management import call_command
+
+        commentator = get_user_model().objects.create_user(username='TestUser_8845')
+        Comment.objects.create(post=post, author=user, text='Коммент 1')
+        Comment.objects.create(post=post, author=commentator, text='Коммент 2')
+        post.refresh_from_db()
+        assert post.comment_count == 2, \
+            'Проверьте, что счетчик `comment_count` увеличивается при создании комментария'
+
+        commentator.delete()
+        post.refresh_from_db()
+        assert post.comment_count == 1, \
+            'Проверьте, что счетчик `comment_count` уменьшается при каскадном удалении комментариев'
+
+        Post.objects.filter(pk=post.pk).update(comment_count=100)
+        call_command('rebuild_comment_counts')
+        post.refresh_from_db()
+        assert post.comment_count == 1, \
+            'Проверьте, что команда `rebuild_comment_counts` пересчитывает счетчики'
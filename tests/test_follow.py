@@ -3,7 +3,7 @@ import tempfile
 
 import pytest
 from django.contrib.auth import get_user_model
-from django.core.paginator import Paginator, Page
+from posts.paginator import KeysetPaginator, KeysetPage
 from django.db.models import fields
 
 try:
@@ -170,14 +170,14 @@ class TestFollow:
             "paginator" in response.context
         ), "Проверьте, что передали переменную `paginator` в контекст страницы `/follow/`"
         assert (
-            type(response.context["paginator"]) == Paginator
-        ), "Проверьте, что переменная `paginator` на странице `/follow/` типа `Paginator`"
+            type(response.context["paginator"]) == KeysetPaginator
+        ), "Проверьте, что переменная `paginator` на странице `/follow/` типа `KeysetPaginator`"
         assert (
             "page" in response.context
         ), "Проверьте, что передали переменную `page` в контекст страницы `/follow/`"
         assert (
-            type(response.context["page"]) == Page
-        ), "Проверьте, что переменная `page` на странице `/follow/` типа `Page`"
+            type(response.context["page"]) == KeysetPage
+        ), "Проверьте, что переменная `page` на странице `/follow/` типа `KeysetPage`"
         assert (
             len(response.context["page"]) == 2
         ), "Проверьте, что на странице `/follow/` список статей авторов на которых подписаны"
@@ -214,3 +214,37 @@ class TestFollow:
         assert (
             len(response.context["page"]) == 0
         ), "Проверьте, что на странице `/follow/` список статей авторов на которых подписаны"
+
+    @pytest.mark.django_db(transaction=True)
+    def test_follow_timeline_celebrity(self, user_client, user, settings):
+        from django.core.management import call_command
+        from posts.models import TimelineEntry
+
+        settings.TIMELINE_CELEBRITY_THRESHOLD = 2
+        author = get_user_model().objects.create_user(username="TestUser_6712")
+        reader = get_user_model().objects.create_user(username="TestUser_6713")
+        Follow.objects.create(author=author, user=reader)
+        Post.objects.create(text="Тестовый пост 1001", author=author)
+        assert TimelineEntry.objects.filter(user=reader).count() == 1, \
+            "Проверьте, что пост раскладывается по лентам подписчиков при публикации"
+
+        # второй подписчик делает автора популярным, новые посты
+        # не раскладываются, а подтягиваются при чтении ленты
+        self.check_url(user_client, f"/{author.username}/follow", "/<username>/follow/")
+        Post.objects.create(text="Тестовый пост 1002", author=author)
+        assert not TimelineEntry.objects.filter(post__text="Тестовый пост 1002").exists()
+        response = self.check_url(user_client, "/follow", "/follow/")
+        assert len(response.context["page"]) == 2, \
+            "Проверьте, что посты популярных авторов подтягиваются в ленту при чтении"
+
+        # после отписки автор снова обычный, его последние посты
+        # должны вернуться в ленты оставшихся подписчиков
+        Follow.objects.filter(author=author, user=reader).delete()
+        assert TimelineEntry.objects.filter(user=user).count() == 2
+        response = self.check_url(user_client, "/follow", "/follow/")
+        assert len(response.context["page"]) == 2
+
+        TimelineEntry.objects.all().delete()
+        call_command("rebuild_timelines")
+        assert TimelineEntry.objects.filter(user=user).count() == 2, \
+            "Проверьте, что команда `rebuild_timelines` собирает ленты заново"
@@ -1,6 +1,6 @@
 import pytest
 
-from django.core.paginator import Paginator, Page
+from posts.paginator import KeysetPaginator, KeysetPage
 
 
 class TestGroupPaginatorView:
@@ -17,12 +17,12 @@ class TestGroupPaginatorView:
 
         assert 'paginator' in response.context, \
             'Проверьте, что передали переменную `paginator` в контекст страницы `/group/<slug>/`'
-        assert type(response.context['paginator']) == Paginator, \
-            'Проверьте, что переменная `paginator` на странице `/group/<slug>/` типа `Paginator`'
+        assert type(response.context['paginator']) == KeysetPaginator, \
+            'Проверьте, что переменная `paginator` на странице `/group/<slug>/` типа `KeysetPaginator`'
         assert 'page' in response.context, \
             'Проверьте, что передали переменную `page` в контекст страницы `/group/<slug>/`'
-        assert type(response.context['page']) == Page, \
-            'Проверьте, что переменная `page` на странице `/group/<slug>/` типа `Page`'
+        assert type(response.context['page']) == KeysetPage, \
+            'Проверьте, что переменная `page` на странице `/group/<slug>/` типа `KeysetPage`'
 
     @pytest.mark.django_db(transaction=True)
     def test_index_paginator_view_get(self, client, post_with_group):
@@ -30,9 +30,40 @@ class TestGroupPaginatorView:
         assert response.status_code != 404, 'Страница `/` не найдена, проверьте этот адрес в *urls.py*'
         assert 'paginator' in response.context, \
             'Проверьте, что передали переменную `paginator` в контекст страницы `/`'
-        assert type(response.context['paginator']) == Paginator, \
-            'Проверьте, что переменная `paginator` на странице `/` типа `Paginator`'
+        assert type(response.context['paginator']) == KeysetPaginator, \
+            'Проверьте, что переменная `paginator` на странице `/` типа `KeysetPaginator`'
         assert 'page' in response.context, \
             'Проверьте, что передали переменную `page` в контекст страницы `/`'
-        assert type(response.context['page']) == Page, \
-            'Проверьте, что переменная `page` на странице `/` типа `Page`'
+        assert type(response.context['page']) == KeysetPage, \
+            'Проверьте, что переменная `page` на странице `/` типа `KeysetPage`'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_index_paginator_cursor(self, client, user):
+        from posts.models import Post
+        posts = [Post.objects.create(text=f'Пост {i}', author=user) for i in range(25)]
+        # новые записи идут первыми, порядок (pub_date, id) строгий даже при равных датах
+        expected = sorted(posts, key=lambda post: (post.pub_date, post.id), reverse=True)
+
+        response = client.get('/')
+        page = response.context['page']
+        assert list(page) == expected[:10], 'Проверьте, что первая страница `/` содержит 10 новых записей'
+        assert page.has_next() and not page.has_previous(), \
+            'Проверьте, что у первой страницы `/` есть только следующая страница'
+
+        response = client.get(f'/?after={page.next_cursor()}')
+        page = response.context['page']
+        assert list(page) == expected[10:20], 'Проверьте переход на следующую страницу по `?after=`'
+        assert page.has_next() and page.has_previous()
+
+        response = client.get(f'/?after={page.next_cursor()}')
+        last_page = response.context['page']
+        assert list(last_page) == expected[20:], 'Проверьте, что последняя страница содержит остаток записей'
+        assert not last_page.has_next()
+
+        response = client.get(f'/?before={last_page.previous_cursor()}')
+        page = response.context['page']
+        assert list(page) == expected[10:20], 'Проверьте переход на предыдущую страницу по `?before=`'
+
+        response = client.get('/?after=not-a-cursor')
+        assert list(response.context['page']) == expected[:10], \
+            'Проверьте, что неправильный курсор отдает первую страницу'
@@ -1,6 +1,6 @@
 import pytest
 
-from django.core.paginator import Paginator, Page
+from posts.paginator import KeysetPaginator, KeysetPage
 from django.contrib.auth import get_user_model
 
 
@@ -26,15 +26,15 @@ class TestProfileView:
         profile_context = get_field_context(response.context, get_user_model())
         assert profile_context is not None, 'Проверьте, что передали автора в контекст страницы `/<username>/`'
 
-        page_context = get_field_context(response.context, Page)
+        page_context = get_field_context(response.context, KeysetPage)
         assert page_context is not None, \
-            'Проверьте, что передали статьи автора в контекст страницы `/<username>/` типа `Page`'
+            'Проверьте, что передали статьи автора в контекст страницы `/<username>/` типа `KeysetPage`'
         assert len(page_context.object_list) == 1, \
             'Проверьте, что правильные статьи автора в контекст страницы `/<username>/`'
 
-        paginator_context = get_field_context(response.context, Paginator)
+        paginator_context = get_field_context(response.context, KeysetPaginator)
         assert paginator_context is not None, \
-            'Проверьте, что передали паджинатор в контекст страницы `/<username>/` типа `Paginator`'
+            'Проверьте, что передали паджинатор в контекст страницы `/<username>/` типа `KeysetPaginator`'
 
         new_user = get_user_model()(username='new_user_87123478')
         new_user.save()
@@ -45,8 +45,42 @@ class TestProfileView:
         if new_response.status_code in (301, 302):
             new_response = client.get(f'/{new_user.username}/')
 
-        page_context = get_field_context(new_response.context, Page)
+        page_context = get_field_context(new_response.context, KeysetPage)
         assert page_context is not None, \
-            'Проверьте, что передали статьи автора в контекст страницы `/<username>/` типа `Page`'
+            'Проверьте, что передали статьи автора в контекст страницы `/<username>/` типа `KeysetPage`'
         assert len(page_context.object_list) == 0, \
             'Проверьте, что правильные статьи автора в контекст страницы `/<username>/`'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_profile_stats(self, user_client, user, post):
+        from django.core.management import call_command
+        from posts.models import Post, UserStats
+
+        author = get_user_model().objects.create_user(username='TestUser_5521')
+        user_client.get(f'/{author.username}/follow/')
+        user_client.post('/new/', data={'text': 'Тестовый пост 8841'})
+        Post.objects.create(text='Тестовый пост 8842', author=author)
+
+        response = user_client.get(f'/{author.username}/')
+        assert response.context['posts_count'] == 1, \
+            'Проверьте, что на странице `/<username>/` выводится количество записей автора'
+        assert response.context['following_count'] == 1, \
+            'Проверьте, что на странице `/<username>/` выводится количество подписчиков'
+        assert response.context['following'], \
+            'Проверьте, что на странице `/<username>/` определяется подписка текущего пользователя'
+
+        stats = UserStats.objects.get(user=user)
+        assert (stats.posts_count, stats.following_count) == (2, 1), \
+            'Проверьте, что счетчики пользователя обновляются при создании поста и подписке'
+
+        user_client.get(f'/{author.username}/unfollow')
+        user_client.get(f'/{user.username}/{post.id}/delete')
+        stats.refresh_from_db()
+        assert (stats.posts_count, stats.following_count) == (1, 0), \
+            'Проверьте, что счетчики пользователя обновляются при удалении поста и отписке'
+
+        UserStats.objects.update(posts_count=10, followers_count=10, following_count=10)
+        call_command('rebuild_user_stats')
+        stats = UserStats.objects.get(user=author)
+        assert (stats.posts_count, stats.followers_count, stats.following_count) == (1, 0, 0), \
+            'Проверьте, что команда `rebuild_user_stats` пересчитывает счетчики'
@@ -1,5 +1,11 @@
 import datetime as dt
+import io
+import json
+import os
 import shutil
+import tempfile
+import threading
+from unittest import mock
 # from urllib.parse import urlencode
 
 # import lxml.html
@@ -9,13 +15,42 @@ from django.core import mail
 from django.core.cache import cache
 from django.core.cache.backends import locmem
 from django.core.cache.utils import make_template_fragment_key
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
 # from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
 
-from posts.models import Follow, Group, Post, User
+from posts import (
+    bulk,
+    counters,
+    garbage,
+    search,
+    synthetic,
+    terms,
+    thumbnails,
+    variants,
+)
+from posts.models import (
+    Comment,
+    Follow,
+    Group,
+    Post,
+    PostTerm,
+    TimelineEntry,
+    User,
+)
+from posts.search import SearchPage
+from posts.uploads import BoundedUploadHandler
 # from posts.views import post_edit
+from users.forms import CreationForm
 from users.views import SignUp
+from yatube import metrics, nplusone
+from yatube.cache import FileBasedCache
 
 
 # Пользователь регистрируется и ему отправляется письмо с подтверждением регистрации
@@ -60,6 +95,16 @@ class EmailTest(TestCase):
         self.assertEqual(mail.outbox[0].from_email, "yatube@mail.ru")
         self.assertEqual(mail.outbox[0].to, ["terminator@mail.ru"])
 
+    def test_reserved_usernames(self):
+        # имена, которые перекрыли бы адреса поиска, тегов и других
+        # страниц, занять нельзя
+        data = {"password1": "skynetMyLove", "password2": "skynetMyLove"}
+        for username in ("search", "tag", "group", "follow", "new", "admin"):
+            form = CreationForm({**data, "username": username})
+            self.assertIn("username", form.errors, username)
+        form = CreationForm({**data, "username": "terminator"})
+        self.assertTrue(form.is_valid(), form.errors)
+
 
 # используем для отключения кэша во время теста
 @override_settings(CACHES=settings.TEST_CACHES)
@@ -281,6 +326,92 @@ class ImageTest(TestCase):
         response = self.client.get("/sarah/2/")  # страница конкретной записи
         self.assertContains(response, text="<img")
 
+    def test_thumbnail_pregenerated(self):
+        # миниатюра строится заранее, и лента выводит ее вместо оригинала
+        img = "tests/for_image_testing/favicon.png"
+        with open(img, "rb") as fp:
+            self.client.post(
+                "/new/", {"text": "I ll be back!", "image": fp, "group": 1}
+            )
+        post = Post.objects.get(text="I ll be back!")
+        thumbnails.schedule(post.image.name)
+        url = thumbnails.cached_url(post.image, "post_card")
+        self.assertNotEqual(url, post.image.url)
+        response = self.client.get("/")
+        self.assertContains(response, url)
+
+    def test_image_variants(self):
+        # для srcset строятся варианты картинки, которые попадают в ленту,
+        # а при замене картинки варианты старой сбрасываются
+        img = "tests/for_image_testing/favicon.png"
+        with open(img, "rb") as fp:
+            self.client.post(
+                "/new/", {"text": "I ll be back!", "image": fp, "group": 1}
+            )
+        post = Post.objects.get(text="I ll be back!")
+        thumbnails.schedule(post.image.name)
+        post.refresh_from_db()
+        # картинка меньше 480 пикселей, поэтому вариант только один
+        self.assertEqual(post.image_variants, "480")
+        name = variants.variant_name(post.image.name, 480, "jpeg")
+        self.assertTrue(default_storage.exists(name))
+        response = self.client.get("/")
+        self.assertContains(response, default_storage.url(name) + " 480w")
+        with open(img, "rb") as fp:
+            self.client.post(
+                reverse("post_edit", args=["sarah", post.id]),
+                {"text": "I ll be back!", "image": fp},
+            )
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants, "")
+
+    def test_feed_refreshed_after_thumbnail_built(self):
+        # миниатюра, поставленная в очередь из ленты, после построения
+        # сбрасывает кеш лент, где закеширован адрес оригинала
+        img = "tests/for_image_testing/favicon.png"
+        with open(img, "rb") as fp:
+            self.client.post(
+                "/new/", {"text": "I ll be back!", "image": fp, "group": 1}
+            )
+        post = Post.objects.get(text="I ll be back!")
+        version = self.client.get("/").context["feed_version"]
+        response = self.client.get("/")
+        self.assertNotEqual(response.context["feed_version"], version)
+        url = thumbnails.cached_url(post.image, "post_card")
+        self.assertNotEqual(url, post.image.url)
+        self.assertContains(response, url)
+
+    def test_thumbnails_prefetched(self):
+        # адреса миниатюр страницы ленты получаются одним запросом
+        # к хранилищу ключей и сохраняются в постах
+        img = "tests/for_image_testing/favicon.png"
+        with open(img, "rb") as fp:
+            self.client.post(
+                "/new/", {"text": "I ll be back!", "image": fp, "group": 1}
+            )
+        post = Post.objects.get(text="I ll be back!")
+        thumbnails.schedule(post.image.name)
+        url = thumbnails.cached_url(post.image, "post_card")
+        response = self.client.get("/")
+        page_post = response.context["page"][0]
+        self.assertEqual(page_post.thumbnails["post_card"], url)
+        self.assertFalse(hasattr(response.context["page"][1], "thumbnails"))
+
+    def test_broken_image_not_rescheduled(self):
+        # картинку, миниатюры которой построить не удалось, ленты
+        # не ставят в очередь на каждом показе
+        name = default_storage.save(
+            "posts/broken.jpg", ContentFile(b"not an image")
+        )
+        post = Post.objects.create(text="Битая", author=self.user, image=name)
+        with self.assertLogs("posts.thumbnails", "ERROR"):
+            url = thumbnails.cached_url(post.image, "post_card")
+        self.assertEqual(url, post.image.url)
+        with self.assertNoLogs("posts.thumbnails", "ERROR"):
+            thumbnails.cached_url(post.image, "post_card")
+            thumbnails.prefetch_thumbnails([post])
+        self.assertEqual(post.thumbnails["post_card"], post.image.url)
+
     def test_valid_image(self):
         # проверка, что загрузить можно только картинки.
         # сначала загружаем картинку, должен произойти редирект(код 302)
@@ -300,6 +431,148 @@ class ImageTest(TestCase):
             )
         self.assertEqual(response.status_code, 200)
 
+    def test_duplicate_images_share_file(self):
+        # одинаковые картинки хранятся одним файлом, который удаляется
+        # вместе с последним ссылающимся на него постом
+        img = "tests/for_image_testing/favicon.png"
+        for text in ("I ll be back!", "Hasta la vista, baby"):
+            with open(img, "rb") as fp:
+                self.client.post("/new/", {"text": text, "image": fp})
+        first, second = Post.objects.exclude(image="").order_by("id")
+        self.assertEqual(first.image.name, second.image.name)
+        path = first.image.path
+        first.delete()
+        with override_settings(POST_IMAGE_RELEASE_GRACE=0):
+            thumbnails.release(first.image.name)
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        # только что загруженную картинку мог взять незакоммиченный пост
+        thumbnails.release(second.image.name)
+        self.assertTrue(os.path.exists(path))
+        # повторная загрузка того же файла продлевает ему жизнь
+        os.utime(path, (0, 0))
+        with open(img, "rb") as fp:
+            self.client.post("/new/", {"text": "I ll be back!", "image": fp})
+        self.assertGreater(os.path.getmtime(path), 0)
+        Post.objects.filter(image=second.image.name).delete()
+        with override_settings(POST_IMAGE_RELEASE_GRACE=0):
+            thumbnails.release(second.image.name)
+        self.assertFalse(os.path.exists(path))
+
+    def test_collect_media_garbage(self):
+        # сборщик удаляет только файлы, на которые не ссылается ни один пост
+        img = "tests/for_image_testing/favicon.png"
+        with open(img, "rb") as fp:
+            self.client.post("/new/", {"text": "I ll be back!", "image": fp})
+        post = Post.objects.get(text="I ll be back!")
+        orphan = default_storage.save("posts/orphan.png", ContentFile(b"x"))
+        out = io.StringIO()
+        call_command(
+            "collect_media_garbage", dry_run=True, min_age=0, stdout=out
+        )
+        self.assertIn(orphan, out.getvalue())
+        self.assertTrue(default_storage.exists(orphan))
+        call_command("collect_media_garbage", min_age=0, stdout=out)
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(post.image.name))
+
+    def test_collect_media_garbage_resumes(self):
+        # запуск с --limit продолжает обход с места прошлой остановки
+        orphans = [
+            default_storage.save(f"posts/orphan{n}.png", ContentFile(b"x"))
+            for n in range(3)
+        ]
+        out = io.StringIO()
+        call_command("collect_media_garbage", min_age=0, limit=2, stdout=out)
+        self.assertEqual(
+            [default_storage.exists(name) for name in orphans],
+            [False, False, True],
+        )
+        # файл перед местом остановки дождется следующего полного обхода
+        early = default_storage.save("posts/orphan.png", ContentFile(b"x"))
+        call_command("collect_media_garbage", min_age=0, limit=2, stdout=out)
+        self.assertFalse(default_storage.exists(orphans[2]))
+        self.assertTrue(default_storage.exists(early))
+        call_command("collect_media_garbage", min_age=0, stdout=out)
+        self.assertFalse(default_storage.exists(early))
+
+    def test_collect_media_garbage_rechecks_before_delete(self):
+        # пост мог взять файл между обходом и удалением
+        with open("tests/for_image_testing/favicon.png", "rb") as fp:
+            orphan = default_storage.save(
+                "posts/orphan.png", ContentFile(fp.read())
+            )
+        found = [name for name, _ in garbage.find_garbage(dt.timedelta(0))]
+        self.assertIn(orphan, found)
+        self.post.image = orphan
+        self.post.save()
+        self.assertFalse(garbage.delete_garbage(orphan, dt.timedelta(0)))
+        self.assertTrue(default_storage.exists(orphan))
+        # файл моложе min_age тоже остается
+        Post.objects.filter(image=orphan).update(image="")
+        self.assertFalse(garbage.delete_garbage(orphan))
+        self.assertTrue(default_storage.exists(orphan))
+        self.assertTrue(garbage.delete_garbage(orphan, dt.timedelta(0)))
+        self.assertFalse(default_storage.exists(orphan))
+
+    @override_settings(POST_IMAGE_MAX_SIZE=100)
+    def test_oversize_image_not_buffered(self):
+        # файл больше лимита отбрасывается при чтении запроса,
+        # а форма сообщает о размере
+        img = "tests/for_image_testing/favicon.png"
+        with open(img, "rb") as fp:
+            response = self.client.post(
+                "/new/", {"text": "I ll be back!", "image": fp}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            "Размер загружаемого файла", str(response.context["form"].errors)
+        )
+        self.assertFalse(Post.objects.filter(text="I ll be back!").exists())
+
+    @override_settings(POST_IMAGE_MAX_SIZE=100)
+    def test_upload_limit_only_in_post_forms(self):
+        # лимит картинок постов не действует на остальные загрузки сайта
+        request = RequestFactory().post("/admin/", {})
+        self.assertFalse(
+            any(
+                isinstance(handler, BoundedUploadHandler)
+                for handler in request.upload_handlers
+            )
+        )
+        # а формы постов по-прежнему проверяют CSRF
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post("/new/", {"text": "I ll be back!"})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_image_resolution_limit(self):
+        # разрешение проверяется по заголовку файла
+        img = "tests/for_image_testing/favicon.png"
+        with open(img, "rb") as fp:
+            response = self.client.post(
+                "/new/", {"text": "I ll be back!", "image": fp}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("32x32", str(response.context["form"].errors))
+
+    @override_settings(POST_IMAGE_MAX_DIMENSION=100)
+    def test_image_normalized(self):
+        # картинка перекодируется без EXIF и уменьшается до лимита
+        exif = Image.Exif()
+        exif[0x010F] = "Skynet"  # производитель камеры
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 200)).save(buffer, "JPEG", exif=exif)
+        buffer.name = "photo.jpg"
+        buffer.seek(0)
+        self.client.post("/new/", {"text": "I ll be back!", "image": buffer})
+        post = Post.objects.get(text="I ll be back!")
+        with post.image.open() as fp:
+            image = Image.open(fp)
+            self.assertEqual(image.size, (100, 50))
+            self.assertNotIn("exif", image.info)
+
     def test_valid_image_size(self):
         # проверка, что загружаемый файл не превышает 5 Мбайт.
         # для проверки попробуем загрузить изображение размером 15 Мбайт
@@ -336,13 +609,164 @@ class CacheTest(TestCase):
 
     def test_index_cache_alternative_method(self):
         # второй способ, решил написать отдельно.
-        key = make_template_fragment_key(
-            "index_page", [1]
-        )  # аргумент [1], так как в шаблоне
-        # добавили номер страницы из паджинатора
+        # в шаблоне ключ состоит из курсора страницы (у первой страницы
+        # он пустой) и id пользователя, поколение ленты хранится в значении
+        key = make_template_fragment_key("index_page", ["", None, False])
         self.assertFalse(cache.get(key))
-        response = self.client.get("/") # noqa
-        self.assertTrue(cache.get(key))
+        response = self.client.get("/")
+        version, fragment, fresh_until = cache.get(key)
+        self.assertEqual(version, response.context["feed_version"])
+
+    def test_index_cache_invalidated_on_new_post(self):
+        # новый пост сразу меняет поколение ленты главной страницы
+        user = User.objects.create_user(username="sarah", password="12345")
+        response = self.client.get("/")
+        version = response.context["feed_version"]
+        Post.objects.create(text="It's driving me crazy!", author=user)
+        response = self.client.get("/")
+        self.assertNotEqual(response.context["feed_version"], version)
+        self.assertContains(response, "driving me crazy")
+
+    def test_profile_fragments_not_shared(self):
+        # подписка сдвигает поколения обоих пользователей одним значением,
+        # поэтому в ключе фрагмента профиля должно быть имя пользователя
+        sarah = User.objects.create_user(username="sarah", password="12345")
+        leo = User.objects.create_user(username="leo", password="12345")
+        Post.objects.create(text="It's driving me crazy!", author=sarah)
+        Post.objects.create(text="Roar!", author=leo)
+        Follow.objects.create(author=sarah, user=leo)
+        response = self.client.get(reverse("profile", args=["sarah"]))
+        version = response.context["feed_version"]
+        response = self.client.get(reverse("profile", args=["leo"]))
+        self.assertEqual(response.context["feed_version"], version)
+        self.assertContains(response, "Roar!")
+        self.assertNotContains(response, "driving me crazy")
+
+    def test_group_rename_refreshes_feeds(self):
+        user = User.objects.create_user(username="sarah", password="12345")
+        group = Group.objects.create(slug="dogs", title="Псы")
+        Post.objects.create(text="Гав", author=user, group=group)
+        pages = [
+            reverse("index"),
+            reverse("group_posts", args=["dogs"]),
+            reverse("profile", args=["sarah"]),
+        ]
+        for url in pages:
+            self.assertContains(self.client.get(url), "Псы")
+        group.title = "Собаки"
+        group.slug = "hounds"
+        group.save()
+        # страница по старому адресу не отдается из кеша
+        response = self.client.get(pages.pop(1))
+        self.assertEqual(response.status_code, 404)
+        pages.append(reverse("group_posts", args=["hounds"]))
+        for url in pages:
+            response = self.client.get(url)
+            self.assertContains(response, "Собаки")
+            self.assertNotContains(response, "Псы")
+
+    def test_index_menu_follows_subscription(self):
+        # меню в закешированной ленте зависит от того, есть ли подписки
+        user = User.objects.create_user(username="sarah", password="12345")
+        author = User.objects.create_user(username="leo", password="12345")
+        self.client.force_login(user)
+        menu = 'class="nav-link active" href="/follow"'
+        self.assertContains(self.client.get(reverse("index")), menu)
+        Follow.objects.create(user=user, author=author)
+        self.assertNotContains(self.client.get(reverse("index")), menu)
+
+    def test_index_cache_serves_stale_while_recomputing(self):
+        # пока другой процесс держит блокировку пересчета,
+        # отдается предыдущая копия ленты
+        user = User.objects.create_user(username="sarah", password="12345")
+        key = make_template_fragment_key("index_page", ["", None, False])
+        self.client.get("/")
+        cache.add(f"{key}:lock", 1)
+        Post.objects.create(text="It's driving me crazy!", author=user)
+        response = self.client.get("/")
+        self.assertNotContains(response, "driving me crazy")
+        cache.delete(f"{key}:lock")
+        response = self.client.get("/")
+        self.assertContains(response, "driving me crazy")
+
+    def test_file_cache_add_is_atomic(self):
+        # блокировку пересчета получает ровно один из одновременных add
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_cache = FileBasedCache(directory, {})
+        results = []
+        barrier = threading.Barrier(8)
+
+        def add():
+            barrier.wait()
+            results.append(file_cache.add("lock", 1, timeout=10))
+
+        threads = [threading.Thread(target=add) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+        # просроченная блокировка не мешает взять новую
+        file_cache.set("lock", 1, timeout=-1)
+        self.assertTrue(file_cache.add("lock", 2))
+        self.assertEqual(file_cache.get("lock"), 2)
+
+    def test_anonymous_page_cache(self):
+        # анонимный читатель получает страницу из кеша без рендера шаблонов,
+        # новый комментарий сбрасывает закешированную страницу поста
+        user = User.objects.create_user(username="sarah", password="12345")
+        post = Post.objects.create(text="It's driving me crazy!", author=user)
+        url = reverse("post", args=["sarah", post.id])
+        response = self.client.get(url)
+        self.assertIsNotNone(response.context)
+        response = self.client.get(url)
+        self.assertIsNone(response.context)
+        self.assertContains(response, "driving me crazy")
+        post.comment_post.create(author=user, text="Hi, Sarah!")
+        response = self.client.get(url)
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, "Hi, Sarah!")
+        # залогиненный пользователь всегда получает свежую страницу
+        self.client.login(username="sarah", password="12345")
+        response = self.client.get(url)
+        self.assertIsNotNone(response.context)
+
+    def test_index_not_modified(self):
+        # повторный запрос с тем же ETag получает 304 без тела,
+        # новый пост меняет валидаторы
+        user = User.objects.create_user(username="sarah", password="12345")
+        response = self.client.get("/")
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+        Post.objects.create(text="It's driving me crazy!", author=user)
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_post_not_modified_only_with_same_csrf_token(self):
+        # после повторного входа токен CSRF новый, и страница с формой
+        # комментария должна прийти заново, а не 304 со старой формой
+        user = User.objects.create_user(username="sarah", password="12345")
+        post = Post.objects.create(text="It's driving me crazy!", author=user)
+        self.client.login(username="sarah", password="12345")
+        url = reverse("post", args=["sarah", post.id])
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "a" * 64
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "b" * 64
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # редирект на верный адрес поста не получает валидаторов
+        User.objects.create_user(username="leo", password="12345")
+        response = self.client.get(reverse("post", args=["leo", post.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
 
 
 class FollowTest(TestCase):
@@ -429,6 +853,60 @@ class FollowTest(TestCase):
         # testuser3 должен видеть пост testuser2
         self.assertContains(response, text="I ll be back")
 
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=2)
+    def test_timeline_pages_merge_celebrity_posts(self):
+        # пост testuser2 попадает в ленту testuser3 до того,
+        # как testuser2 станет популярным, и не должен повториться
+        Follow.objects.create(user=self.user3, author=self.user2)
+        Follow.objects.create(user=self.user1, author=self.user2)
+        Follow.objects.create(user=self.user3, author=self.user1)
+        for number in range(12):
+            author = self.user2 if number % 2 else self.user1
+            Post.objects.create(text=f"Пост {number}", author=author)
+        expected = list(
+            Post.objects.filter(author__in=[self.user1, self.user2])
+            .order_by("-pub_date", "-pk")
+            .values_list("pk", flat=True)
+        )
+        self.client.force_login(self.user3)
+        first = self.client.get(reverse("follow_index")).context["page"]
+        self.assertTrue(first.has_next())
+        second = self.client.get(
+            reverse("follow_index"), {"after": first.next_cursor()}
+        ).context["page"]
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            [post.pk for post in first] + [post.pk for post in second],
+            expected,
+        )
+        back = self.client.get(
+            reverse("follow_index"), {"before": second.previous_cursor()}
+        ).context["page"]
+        self.assertEqual([post.pk for post in back], expected[:10])
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=3)
+    def test_unfollow_celebrity_backfills_in_one_query(self):
+        user4 = User.objects.create_user(username="testuser4")
+        for user in (self.user1, self.user3, user4):
+            Follow.objects.create(user=user, author=self.user2)
+        # первые подписчики получили посты до того, как автор стал
+        # популярным; убираем их, чтобы проверить именно догрузку
+        TimelineEntry.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            Follow.objects.filter(user=user4).delete()
+        inserts = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(
+                f"INSERT INTO {TimelineEntry._meta.db_table}"
+            )
+        ]
+        self.assertEqual(len(inserts), 1)
+        for user in (self.user1, self.user3):
+            self.assertTrue(
+                TimelineEntry.objects.filter(user=user, post=self.post).exists()
+            )
+
 
 class CommentTest(TestCase):
     """
@@ -536,3 +1014,539 @@ class CommentTest(TestCase):
             text="Hi, Sarah!",
             msg_prefix="Проверьте, что в settings.py включен CAPTCHA_TEST_MODE = True",
         )  # комментарий к нему
+
+    def test_post_delete_handles_comments_once(self):
+        # каскадное удаление комментариев вместе с постом не пересчитывает
+        # счетчик, поиск и поколения лент для каждого комментария
+        user = User.objects.create_user(username="sarah", password="12345")
+        post = Post.objects.create(text="It s driving me crazy!", author=user)
+        other = Post.objects.create(text="Hasta la vista", author=user)
+        for n in range(20):
+            Comment.objects.create(post=post, author=user, text=f"Привет {n}")
+        Comment.objects.create(post=other, author=user, text="Пока")
+        with CaptureQueriesContext(connection) as queries:
+            post.delete()
+        self.assertLess(len(queries), 12)
+        self.assertEqual(list(SearchPage("привет", 10)), [])
+        # комментарии других постов по-прежнему обрабатываются
+        self.assertEqual(list(SearchPage("пока", 10)), [other])
+        other.comment_post.get().delete()
+        other.refresh_from_db()
+        self.assertEqual(other.comment_count, 0)
+        self.assertEqual(list(SearchPage("пока", 10)), [])
+
+
+class SearchTest(TestCase):
+    """
+    Проверка полнотекстового поиска по постам
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah", password="12345")
+        self.group = Group.objects.create(slug="dogs", title="Бродячие собаки")
+
+    def test_search_stemming_and_sources(self):
+        # слово находится в другой форме, в названии сообщества
+        # и в комментариях, а совпадение в тексте поста выше остальных
+        in_text = Post.objects.create(text="Я люблю собак", author=self.user)
+        in_group = Post.objects.create(
+            text="Ищу хозяина", author=self.user, group=self.group
+        )
+        in_comment = Post.objects.create(text="Кто это?", author=self.user)
+        in_comment.comment_post.create(author=self.user, text="Это собака!")
+        Post.objects.create(text="Кошки лучше", author=self.user)
+        response = self.client.get(reverse("search"), {"q": "собаками"})
+        found = list(response.context["page"])
+        self.assertEqual(len(found), 3)
+        self.assertEqual(found[0], in_text)
+        self.assertCountEqual(found, [in_text, in_group, in_comment])
+
+    def test_search_index_follows_changes(self):
+        post = Post.objects.create(
+            text="Терминатор вернется", author=self.user
+        )
+        page = SearchPage("терминатора", 10)
+        self.assertEqual(list(page), [post])
+        post.text = "Скайнет победил"
+        post.save()
+        self.assertEqual(list(SearchPage("терминатора", 10)), [])
+        self.assertEqual(list(SearchPage("скайнет", 10)), [post])
+        post.delete()
+        self.assertEqual(list(SearchPage("скайнет", 10)), [])
+
+    def test_comments_indexed_one_by_one(self):
+        post = Post.objects.create(text="Кто это?", author=self.user)
+        post.comment_post.create(author=self.user, text="Это собака")
+        with CaptureQueriesContext(connection) as queries:
+            comment = post.comment_post.create(
+                author=self.user, text="Нет, терминатор"
+            )
+        # остальные комментарии поста не перечитываются
+        comment_table = Comment._meta.db_table
+        self.assertFalse(
+            any(
+                f'FROM "{comment_table}"' in query["sql"]
+                for query in queries.captured_queries
+            )
+        )
+        self.assertEqual(list(SearchPage("собака", 10)), [post])
+        self.assertEqual(list(SearchPage("терминатор", 10)), [post])
+        comment.delete()
+        self.assertEqual(list(SearchPage("терминатор", 10)), [])
+        self.assertEqual(list(SearchPage("собака", 10)), [post])
+
+    def test_rebuild_index_keeps_index_on_error(self):
+        post = Post.objects.create(text="Терминатор", author=self.user)
+        with mock.patch.object(search, "_store", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                search.rebuild_index()
+        self.assertEqual(list(SearchPage("терминатор", 10)), [post])
+
+    def test_search_cursor(self):
+        # результаты листаются курсором без повторов и пропусков
+        posts = [
+            Post.objects.create(text=f"Терминатор {number}", author=self.user)
+            for number in range(5)
+        ]
+        found = []
+        page = SearchPage("терминатор", 2)
+        while True:
+            found.extend(page)
+            if not page.has_next():
+                break
+            page = SearchPage("терминатор", 2, after=page.next_cursor())
+        self.assertCountEqual(found, posts)
+        self.assertEqual(len(found), 5)
+
+
+class TermsTest(TestCase):
+    """
+    Проверка хештегов и упоминаний
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="sarah", email="connor.s@skynet.com", password="12345"
+        )
+        self.john = User.objects.create_user(
+            username="john", email="john@skynet.com", password="12345"
+        )
+
+    def test_extract_terms(self):
+        self.assertEqual(
+            terms.extract_terms("#Skynet и @john, пишите на t800@skynet.com"),
+            {"#skynet", "@john"},
+        )
+
+    def test_tag_feed(self):
+        # пост попадает в ленту тега, а после правки текста пропадает из нее
+        post = Post.objects.create(
+            text="Судный день #Skynet", author=self.user
+        )
+        Post.objects.create(text="Без тегов", author=self.user)
+        response = self.client.get(reverse("tag_posts", args=["skynet"]))
+        self.assertEqual(list(response.context["page"]), [post])
+        self.assertContains(
+            response, f'<a href="{reverse("tag_posts", args=["skynet"])}">'
+        )
+        post.text = "Судный день отменен"
+        post.save()
+        response = self.client.get(reverse("tag_posts", args=["skynet"]))
+        self.assertEqual(list(response.context["page"]), [])
+
+    def test_tag_feed_pages(self):
+        # лента тега листается курсорами по индексу (term, pub_date, post),
+        # дата публикации копируется в запись индекса
+        posts = [
+            Post.objects.create(text=f"#Skynet {n}", author=self.user)
+            for n in range(12)
+        ]
+        dates = PostTerm.objects.filter(term="#skynet").values_list(
+            "post__pub_date", "pub_date"
+        )
+        self.assertTrue(all(post_date == copy for post_date, copy in dates))
+        url = reverse("tag_posts", args=["skynet"])
+        page = self.client.get(url).context["page"]
+        found = list(page)
+        page = self.client.get(url, {"after": page.next_cursor()}).context[
+            "page"
+        ]
+        found.extend(page)
+        self.assertFalse(page.has_next())
+        self.assertEqual(found, posts[::-1])
+
+    def test_mention_notification(self):
+        # упомянутый пользователь получает письмо, автор - нет
+        post = Post.objects.create(
+            text="@john, @sarah, это вы?", author=self.user
+        )
+        terms.notify_mentioned(post, ["john", "sarah"])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["john@skynet.com"])
+
+    def test_rebuild_terms(self):
+        Post.objects.create(text="#one #two @john", author=self.user)
+        PostTerm.objects.all().delete()
+        self.assertEqual(terms.rebuild_terms(batch_size=1), 3)
+
+    def test_rebuild_terms_keeps_index_on_error(self):
+        Post.objects.create(text="#one #two", author=self.user)
+        with mock.patch.object(terms, "extract_terms", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                terms.rebuild_terms()
+        self.assertEqual(PostTerm.objects.count(), 2)
+
+
+class GroupCountTest(TestCase):
+    """
+    Проверка счетчика записей сообщества
+    """
+
+    def test_group_post_count(self):
+        user = User.objects.create_user(username="sarah", password="12345")
+        dogs = Group.objects.create(slug="dogs", title="псы")
+        cats = Group.objects.create(slug="cats", title="коты")
+        post = Post.objects.create(text="Гав", author=user, group=dogs)
+        Post.objects.create(text="Гав-гав", author=user, group=dogs)
+        dogs.refresh_from_db()
+        self.assertEqual(dogs.post_count, 2)
+        response = self.client.get(reverse("group_posts", args=["dogs"]))
+        self.assertContains(response, "Записей: 2")
+        # перенос поста в другое сообщество
+        post.group = cats
+        post.save()
+        dogs.refresh_from_db()
+        cats.refresh_from_db()
+        self.assertEqual((dogs.post_count, cats.post_count), (1, 1))
+        post.delete()
+        cats.refresh_from_db()
+        self.assertEqual(cats.post_count, 0)
+        Group.objects.update(post_count=0)
+        self.assertEqual(counters.rebuild_group_post_counts(), 2)
+        dogs.refresh_from_db()
+        self.assertEqual(dogs.post_count, 1)
+
+
+class BulkDataTest(TestCase):
+    """
+    Проверка потоковых выгрузки и загрузки данных
+    """
+
+    def test_iter_records(self):
+        text = '[\n{"model": "a", "pk": 1},\n{"model": "b", "pk": "]"}\n]\n'
+        records = list(bulk.iter_records(io.StringIO(text), chunk_size=4))
+        self.assertEqual([record["pk"] for record in records], [1, "]"])
+        jsonl = '{"pk": 1}\n{"pk": 2}\n'
+        records = list(bulk.iter_records(io.StringIO(jsonl), chunk_size=3))
+        self.assertEqual(len(records), 2)
+
+    def test_export_import_roundtrip(self):
+        user = User.objects.create_user(username="sarah", password="12345")
+        reader = User.objects.create_user(username="reader", password="1")
+        dogs = Group.objects.create(slug="dogs", title="псы")
+        post = Post.objects.create(text="Гав #псы", author=user, group=dogs)
+        Comment.objects.create(post=post, author=reader, text="Гав-гав")
+        Follow.objects.create(user=reader, author=user)
+        for jsonl in (True, False):
+            out = io.StringIO()
+            exported = bulk.export_records(out, jsonl=jsonl)
+            self.assertEqual(exported["posts.post"], 1)
+            User.objects.all().delete()
+            Group.objects.all().delete()
+            self.assertFalse(Post.objects.exists())
+            out.seek(0)
+            imported, skipped = bulk.import_records(
+                bulk.iter_records(out), batch_size=2
+            )
+            self.assertEqual(imported, exported)
+            bulk.finish_import()
+            post = Post.objects.get()
+            self.assertEqual(post.comment_count, 1)
+            self.assertEqual(post.group.post_count, 1)
+            self.assertEqual(counters.get_user_stats(user).followers_count, 1)
+            self.assertTrue(post.terms.filter(term="#псы").exists())
+            self.assertEqual(len(SearchPage("гав", 10)), 1)
+            # лента подписок собрана заново
+            self.client.login(username="reader", password="1")
+            response = self.client.get(reverse("follow_index"))
+            self.assertContains(response, "Гав")
+        # после загрузки последовательности ключей сдвинуты
+        self.assertGreater(
+            Post.objects.create(text="Мяу", author=user).pk, post.pk
+        )
+
+    def test_import_keeps_dates(self):
+        # даты постов и комментариев берутся из выгрузки,
+        # а не заменяются временем загрузки
+        user = User.objects.create_user(username="sarah", password="12345")
+        posted = dt.datetime(2018, 5, 1, 12, tzinfo=dt.timezone.utc)
+        commented = dt.datetime(2019, 6, 2, 8, tzinfo=dt.timezone.utc)
+        post = Post.objects.create(text="Гав", author=user)
+        comment = Comment.objects.create(post=post, author=user, text="Мяу")
+        Post.objects.filter(pk=post.pk).update(pub_date=posted)
+        Comment.objects.filter(pk=comment.pk).update(created=commented)
+        out = io.StringIO()
+        bulk.export_records(out)
+        User.objects.all().delete()
+        out.seek(0)
+        bulk.import_records(bulk.iter_records(out))
+        self.assertEqual(Post.objects.get().pub_date, posted)
+        self.assertEqual(Comment.objects.get().created, commented)
+        # после загрузки новые посты снова получают текущее время
+        self.assertGreater(
+            Post.objects.create(text="Мяу", author=user).pub_date.year, 2019
+        )
+
+
+@override_settings(MEDIA_ROOT=settings.MEDIA_ROOT_TEST)
+class SyntheticDataTest(TestCase):
+    """
+    Проверка генератора синтетических данных
+    """
+
+    def tearDown(self):
+        shutil.rmtree("media_test", ignore_errors=True)
+
+    def generate(self):
+        created = synthetic.generate(
+            seed=7, users=20, groups=3, posts=60, images=2, password="1"
+        )
+        snapshot = list(
+            Post.objects.order_by("pk").values_list(
+                "author__username", "group__slug", "text", "image", "pub_date"
+            )
+        )
+        snapshot += Comment.objects.order_by("pk").values_list(
+            "post__text", "author__username", "text", "created"
+        )
+        return created, snapshot
+
+    def test_generate(self):
+        created, snapshot = self.generate()
+        self.assertEqual(created["posts"], 60)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(created["comments"], 180)
+        self.assertEqual(
+            sum(Post.objects.values_list("comment_count", flat=True)), 180
+        )
+        self.assertEqual(Follow.objects.count(), created["follows"])
+        self.assertTrue(Post.objects.exclude(image="").exists())
+        # даты публикаций разбросаны, а не совпадают со временем вставки
+        self.assertGreater(
+            Post.objects.values("pub_date").distinct().count(), 1
+        )
+        self.assertFalse(
+            Post.objects.filter(pub_date__gt=synthetic.EPOCH).exists()
+        )
+        self.assertTrue(self.client.login(username="user7_0", password="1"))
+        response = self.client.get(reverse("follow_index"))
+        self.assertEqual(response.status_code, 200)
+        # тот же seed дает те же данные
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.assertEqual(self.generate()[1], snapshot)
+
+
+class ServerTimingTest(TestCase):
+    """
+    Проверка замера запросов к базе и рендеринга
+    """
+
+    def test_no_header_by_default(self):
+        response = self.client.get(reverse("index"))
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_server_timing(self):
+        user = User.objects.create_user(username="sarah", password="12345")
+        Post.objects.create(text="Гав", author=user)
+        with self.assertLogs("yatube.requests", "INFO") as logs:
+            response = self.client.get(reverse("index"))
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="[1-9]\d* queries", '
+            r"render;dur=[\d.]+, total;dur=[\d.]+$",
+        )
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "index")
+        self.assertEqual(record["status"], 200)
+        self.assertGreater(record["queries"], 0)
+        self.assertGreater(record["render_ms"], 0)
+
+
+class MetricsTest(TestCase):
+    """
+    Проверка метрик и страницы /metrics
+    """
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.values.clear()
+        self.user = User.objects.create_user(username="sarah", password="1")
+        Post.objects.create(text="Гав", author=self.user)
+        self.client.login(username="sarah", password="1")
+
+    def test_request_metrics(self):
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn(
+            'yatube_requests_total{status="200",view="index"} 2', text
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="index"} 2', text
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="index",le="+Inf"} 2',
+            text,
+        )
+        self.assertIn(
+            'yatube_feed_cache_total{fragment="index_page",result="miss"} 1',
+            text,
+        )
+        self.assertIn(
+            'yatube_feed_cache_total{fragment="index_page",result="hit"} 1',
+            text,
+        )
+
+    def test_metrics_local_only(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse("metrics"), HTTP_X_FORWARDED_FOR="10.0.0.1"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_summed_across_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # файл другого воркера
+        with open(os.path.join(directory, "1.json"), "w") as out:
+            json.dump([["yatube_thumbnail_failures_total", [], 2]], out)
+        with override_settings(METRICS_DIR=directory):
+            metrics.inc("yatube_thumbnail_failures_total")
+            text = metrics.render()
+        self.assertIn("yatube_thumbnail_failures_total 3", text)
+        self.assertEqual(len(os.listdir(directory)), 2)
+
+
+class ProfilerTest(TestCase):
+    """
+    Проверка профилирования запросов
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.user = User.objects.create_user(username="sarah", password="1")
+        Post.objects.create(text="Гав", author=self.user)
+        self.client.login(username="sarah", password="1")
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_profile_by_header_for_staff_only(self):
+        with override_settings(PROFILER_DIR=self.directory):
+            response = self.client.get(reverse("index"), HTTP_X_PROFILE="1")
+            self.assertNotIn("X-Profile-File", response)
+            self.assertEqual(self.profiles(), [])
+            User.objects.filter(pk=self.user.pk).update(is_staff=True)
+            response = self.client.get(reverse("index"), HTTP_X_PROFILE="1")
+        name = response["X-Profile-File"]
+        self.assertEqual(self.profiles(), [name])
+        self.assertRegex(name, r"^\d+-\d+-index-\d+q-\d+ms\.collapsed$")
+        with open(os.path.join(self.directory, name)) as profile:
+            for line in profile:
+                self.assertRegex(line, r"^\S.*:\S+ \d+$")
+
+    def test_sampled_profiles_ring(self):
+        with override_settings(
+            PROFILER_DIR=self.directory,
+            PROFILER_SAMPLE_RATE=1.0,
+            PROFILER_MAX_FILES=2,
+        ):
+            for _ in range(3):
+                response = self.client.get(reverse("index"))
+        # случайно отобранные запросы не сообщают о профиле клиенту
+        self.assertNotIn("X-Profile-File", response)
+        self.assertEqual(len(self.profiles()), 2)
+
+
+class NPlusOneTest(TestCase):
+    """
+    Проверка поиска повторных запросов N+1
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah", password="1")
+        self.authors = [
+            User.objects.create_user(username=f"author{n}", password="1")
+            for n in range(6)
+        ]
+        for author in self.authors:
+            Post.objects.create(text="Гав", author=author)
+
+    def test_shape(self):
+        self.assertEqual(
+            nplusone.shape('SELECT * FROM "t" WHERE "id" IN (%s, %s) LIMIT 21'),
+            'SELECT * FROM "t" WHERE "id" IN (...) LIMIT ?',
+        )
+
+    def test_detect_lazy_foreign_key(self):
+        with nplusone.detect(threshold=5) as detector:
+            for post in Post.objects.all():
+                post.author.username
+        [(sql, count, code, template)] = detector.offenders()
+        self.assertIn('"auth_user"', sql)
+        self.assertEqual(count, 6)
+        self.assertTrue(code.startswith("tests/tests.py:"), code)
+        self.assertIsNone(template)
+        with self.assertLogs("yatube.nplusone", "WARNING") as logs:
+            nplusone.report("index", detector.offenders())
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "index")
+        self.assertEqual(record["code"], code)
+        with nplusone.detect(threshold=5) as detector:
+            for post in Post.objects.select_related("author"):
+                post.author.username
+        self.assertEqual(detector.offenders(), [])
+
+    def test_follow_without_loops(self):
+        self.client.login(username="sarah", password="1")
+        for author in self.authors[1:]:
+            Follow.objects.create(author=author, user=self.user)
+        author = self.authors[0]
+        # повторная подписка и отписка ничего не ломают
+        for name in [
+            "profile_follow",
+            "profile_follow",
+            "profile_unfollow",
+            "profile_unfollow",
+        ]:
+            with nplusone.detect(threshold=3) as detector:
+                response = self.client.get(
+                    reverse(name, args=[author.username])
+                )
+            self.assertEqual(detector.offenders(), [])
+            self.assertRedirects(
+                response, reverse("profile", args=[author.username])
+            )
+            self.assertEqual(
+                Follow.objects.filter(author=author, user=self.user).exists(),
+                name == "profile_follow",
+            )
+
+    def test_post_delete_with_comments(self):
+        # каскадное удаление комментариев не должно давать N+1,
+        # в строгом режиме тестов такой запрос завершился бы ошибкой
+        self.assertTrue(settings.NPLUSONE_RAISE)
+        author = self.authors[0]
+        post = author.post_author.get()
+        for n in range(settings.NPLUSONE_THRESHOLD + 1):
+            Comment.objects.create(post=post, author=self.user, text=f"{n}")
+        self.client.force_login(author)
+        response = self.client.get(
+            reverse("post_delete", args=[author.username, post.id])
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
@@ -1,9 +1,30 @@
+from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.urls import Resolver404, resolve
 
 User = get_user_model()
 
 
+def is_reserved_username(username):
+    """
+    Имя нельзя занять, если /<имя>/ или /<имя>/<id поста>/ ведут
+    не на профиль и не на пост пользователя, а на другие страницы
+    сайта: search, tag, group, follow, admin и т. д.
+    """
+    for url, url_name in (
+        (f"/{username}/", "profile"),
+        (f"/{username}/1/", "post"),
+    ):
+        try:
+            match = resolve(url)
+        except Resolver404:
+            return True
+        if match.url_name != url_name:
+            return True
+    return False
+
+
 class CreationForm(UserCreationForm):
     """
     Форма регистрации нового пользователя.
@@ -12,3 +33,11 @@ class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ("first_name", "last_name", "username", "email")
+
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        if is_reserved_username(username):
+            raise forms.ValidationError(
+                "Это имя совпадает с адресом страницы сайта, выберите другое"
+            )
+        return username
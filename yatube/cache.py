@@ -0,0 +1,115 @@
+import contextvars
+import hashlib
+import os
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import (
+    FileBasedCache as DjangoFileBasedCache,
+)
+
+# отмечает, что в текущем запросе была отдана устаревшая копия,
+# такой ответ нельзя класть в кеш целиком под новой версией
+stale_served = contextvars.ContextVar("stale_served", default=False)
+
+# ключи memcached ограничены 250 символами и не допускают пробелов
+# и управляющих символов, поэтому такие ключи заменяются их хешем
+MAX_KEY_LENGTH = 250
+
+
+def make_key(key, key_prefix, version):
+    """
+    Функция построения ключей кеша (настройка KEY_FUNCTION):
+    <префикс>:<версия>:<ключ>, слишком длинные или небезопасные
+    для memcached ключи заменяются на sha1
+    """
+    full_key = f"{key_prefix}:{version}:{key}"
+    if len(full_key) > MAX_KEY_LENGTH or any(
+        ord(char) < 33 or ord(char) == 127 for char in full_key
+    ):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        full_key = f"{key_prefix}:{version}:hash:{digest}"
+    return full_key
+
+
+class FileBasedCache(DjangoFileBasedCache):
+    """
+    Файловый кеш с атомарным add. В Django add - это проверка has_key
+    и затем set, между которыми другой воркер успевает сделать то же
+    самое, и блокировку get_or_recompute получают несколько процессов.
+    Здесь значение пишется во временный файл и ставится на место
+    через os.link, который не заменяет существующий файл.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, "wb") as f:
+                self._write_content(f, timeout, value)
+            while True:
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    # has_key удаляет просроченный файл, тогда пробуем снова
+                    if self.has_key(key, version):
+                        return False
+        finally:
+            os.remove(tmp_path)
+
+
+def get_or_recompute(
+    key, compute, version=None, timeout=60, stale_timeout=None, wait=2
+):
+    """
+    Возвращает значение из кеша, пересчитывая его не более чем в одном
+    процессе одновременно (single-flight). Блокировка - cache.add,
+    поэтому бэкенд должен выполнять add атомарно: memcached, redis,
+    база данных, LocMemCache или FileBasedCache из этого модуля.
+
+    Значение хранится вместе с версией и временем свежести. Пока один
+    процесс под блокировкой пересчитывает устаревшее значение (истекло
+    время или сменилась версия), остальные отдают старую копию
+    (stale-while-revalidate). Если копии нет совсем, они ждут
+    пересчета до wait секунд, а потом считают сами.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    lock_key = f"{key}:lock"
+    entry = cache.get(key)
+    if entry is not None:
+        entry_version, value, fresh_until = entry
+        if entry_version == version and time.time() < fresh_until:
+            return value
+        if not cache.add(lock_key, 1, timeout=wait * 5):
+            # пересчетом уже занят другой процесс
+            stale_served.set(True)
+            return value
+        return _recompute(key, lock_key, compute, version, timeout, stale_timeout)
+    if cache.add(lock_key, 1, timeout=wait * 5):
+        return _recompute(key, lock_key, compute, version, timeout, stale_timeout)
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    return compute()
+
+
+def _recompute(key, lock_key, compute, version, timeout, stale_timeout):
+    try:
+        value = compute()
+        cache.set(
+            key,
+            (version, value, time.time() + timeout),
+            timeout=timeout + stale_timeout,
+        )
+        return value
+    finally:
+        cache.delete(lock_key)
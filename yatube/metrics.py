@@ -0,0 +1,224 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Метрики процесса: счетчики и гистограммы с фиксированными корзинами.
+# Каждый процесс (воркер gunicorn) копит значения в памяти и не чаще
+# раза в METRICS_FLUSH_INTERVAL секунд сбрасывает их в свой файл
+# METRICS_DIR/<pid>.json. Страница /metrics складывает файлы всех
+# процессов и отдает сумму в текстовом формате Prometheus.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# имя: (тип, описание, корзины гистограммы)
+METRICS = {
+    "yatube_requests_total": (
+        "counter",
+        "Запросы по имени адреса и статусу ответа",
+        None,
+    ),
+    "yatube_request_duration_seconds": (
+        "histogram",
+        "Время обработки запроса по имени адреса",
+        LATENCY_BUCKETS,
+    ),
+    "yatube_request_queries": (
+        "histogram",
+        "Количество запросов к базе на запрос по имени адреса",
+        QUERY_BUCKETS,
+    ),
+    "yatube_feed_cache_total": (
+        "counter",
+        "Обращения к кешу фрагментов лент: hit или miss",
+        None,
+    ),
+    "yatube_thumbnail_seconds": (
+        "histogram",
+        "Время построения миниатюр и вариантов одной картинки",
+        LATENCY_BUCKETS,
+    ),
+    "yatube_thumbnail_failures_total": (
+        "counter",
+        "Картинки, для которых не удалось построить миниатюры",
+        None,
+    ),
+}
+
+
+class Registry:
+    """
+    Значения метрик одного процесса
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.values = {}
+        self.flushed = 0.0
+
+    def _series(self, name, labels):
+        # после fork у воркера свои значения, родительские не копируются
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.values = {}
+            self.flushed = 0.0
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.values:
+            kind, _, buckets = METRICS[name]
+            if kind == "counter":
+                self.values[key] = 0
+            else:
+                # количества по корзинам, +Inf, сумма значений
+                self.values[key] = [0] * (len(buckets) + 1) + [0]
+        return key
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            key = self._series(name, labels)
+            self.values[key] += value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        with self.lock:
+            key = self._series(name, labels)
+            series = self.values[key]
+            index = next(
+                (i for i, bound in enumerate(buckets) if value <= bound),
+                len(buckets),
+            )
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                [
+                    name,
+                    list(labels),
+                    list(value) if isinstance(value, list) else value,
+                ]
+                for (name, labels), value in self.values.items()
+            ]
+
+    def flush(self, force=False):
+        """
+        Пишет значения процесса в его файл, если прошло
+        METRICS_FLUSH_INTERVAL секунд с прошлой записи
+        """
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (
+            not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL
+        ):
+            return
+        self.flushed = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        # запись через временный файл: читатель не увидит половину файла
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "w") as out:
+            json.dump(self.snapshot(), out)
+        os.replace(temporary, path)
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+flush = registry.flush
+atexit.register(lambda: registry.flush(force=True))
+
+
+def collect():
+    """
+    Складывает значения всех процессов: {(имя, метки): значение}
+    """
+    if settings.METRICS_DIR:
+        registry.flush(force=True)
+        snapshots = []
+        for filename in os.listdir(settings.METRICS_DIR):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(settings.METRICS_DIR, filename)
+            try:
+                with open(path) as fp:
+                    snapshots.append(json.load(fp))
+            except (OSError, ValueError):
+                # файл удалили или это чужой мусор
+                continue
+    else:
+        snapshots = [registry.snapshot()]
+    total = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot:
+            if name not in METRICS:
+                continue
+            key = (name, tuple(tuple(label) for label in labels))
+            if isinstance(value, list):
+                current = total.get(key, [0] * len(value))
+                total[key] = [a + b for a, b in zip(current, value)]
+            else:
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\""))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render():
+    """
+    Текстовый формат Prometheus
+    """
+    values = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        series = sorted(
+            (labels, value)
+            for (metric, labels), value in values.items()
+            if metric == name
+        )
+        for labels, value in series:
+            if kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), value):
+                cumulative += count
+                le = _labels(labels, [("le", bound)])
+                lines.append(f"{name}_bucket{le} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def scrape(request):
+    """
+    Страница /metrics для локального сборщика. Запросы с других адресов
+    и проксированные (с заголовками X-Forwarded-For/X-Real-IP) получают 404.
+    """
+    proxied = any(
+        header in request.META
+        for header in ("HTTP_X_FORWARDED_FOR", "HTTP_X_REAL_IP")
+    )
+    remote = request.META.get("REMOTE_ADDR")
+    if proxied or remote not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(
+        render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("yatube.nplusone")
+
+# Поиск N+1: запросы одного запроса к сайту группируются по «форме» SQL
+# (числа и списки IN заменены заглушками). Форма, повторившаяся
+# NPLUSONE_THRESHOLD раз и больше, попадает в лог вместе с местом
+# в коде и строкой шаблона, откуда ушел повторный запрос. В тестах
+# (NPLUSONE_RAISE) такой запрос к сайту завершается ошибкой.
+
+IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+NUMBER = re.compile(r"\b\d+\b")
+
+# обертки выполнения SQL, которые не являются источником запросов
+WRAPPER_FILES = {
+    os.path.abspath(__file__),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "timing.py"),
+}
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def shape(sql):
+    return NUMBER.sub("?", IN_LIST.sub("(...)", sql))
+
+
+def _origin():
+    """
+    Место в коде проекта и строка шаблона, откуда выполняется запрос
+    """
+    code = template = None
+    frame = sys._getframe(1)
+    while frame is not None and (code is None or template is None):
+        filename = os.path.abspath(frame.f_code.co_filename)
+        node = frame.f_locals.get("self")
+        rendering = frame.f_code.co_name == "render_annotated" and all(
+            getattr(node, attr, None) is not None
+            for attr in ("origin", "token")
+        )
+        if template is None and rendering:
+            template = f"{node.origin.template_name}:{node.token.lineno}"
+        in_project = filename.startswith(settings.BASE_DIR) and not (
+            filename in WRAPPER_FILES or "site-packages" in filename
+        )
+        if code is None and in_project:
+            location = os.path.relpath(filename, settings.BASE_DIR)
+            code = f"{location}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return code, template
+
+
+class Detector:
+    """
+    Обертка выполнения SQL (connection.execute_wrapper), которая
+    считает запросы по формам. Место запроса запоминается один раз,
+    когда форма набирает порог повторов, поэтому обычные запросы
+    стоят только подстановки регулярных выражений.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        key = shape(sql)
+        self.counts[key] += 1
+        if self.counts[key] == self.threshold:
+            self.origins[key] = _origin()
+        return execute(sql, params, many, context)
+
+    def offenders(self):
+        """
+        [(форма SQL, количество, место в коде, строка шаблона)]
+        """
+        ignored = [re.compile(pattern) for pattern in settings.NPLUSONE_IGNORE]
+        return [
+            (key, count, *self.origins[key])
+            for key, count in self.counts.most_common()
+            if count >= self.threshold
+            if not any(pattern.search(key) for pattern in ignored)
+        ]
+
+
+@contextmanager
+def detect(threshold=None):
+    """
+    Считает повторные запросы во всех соединениях внутри блока:
+
+        with detect() as detector:
+            ...
+        detector.offenders()
+    """
+    detector = Detector(threshold or settings.NPLUSONE_THRESHOLD)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(detector))
+        yield detector
+
+
+def report(view, offenders):
+    for sql, count, code, template in offenders:
+        logger.warning(
+            json.dumps(
+                {
+                    "view": view,
+                    "count": count,
+                    "sql": sql[:500],
+                    "code": code,
+                    "template": template,
+                },
+                ensure_ascii=False,
+            )
+        )
+
+
+class NPlusOneMiddleware:
+    """
+    Ищет N+1 в каждом запросе к сайту, см. описание модуля
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.NPLUSONE_ENABLED:
+            return self.get_response(request)
+        with detect() as detector:
+            response = self.get_response(request)
+        offenders = detector.offenders()
+        if not offenders:
+            return response
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else None
+        report(view, offenders)
+        if settings.NPLUSONE_RAISE:
+            sql, count, code, template = offenders[0]
+            raise NPlusOneError(
+                f"{view}: {count} одинаковых запросов из {code} "
+                f"(шаблон {template}): {sql}"
+            )
+        return response
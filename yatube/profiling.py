@@ -0,0 +1,123 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from . import timing
+
+# Профилирование живых запросов. Запрос профилируется, если его прислал
+# сотрудник с заголовком X-Profile, или случайно с вероятностью
+# PROFILER_SAMPLE_RATE. Пока запрос выполняется, отдельный поток раз
+# в PROFILER_INTERVAL секунд снимает стек потока запроса. Стеки
+# пишутся в формате collapsed («a;b;c 12» - стек и число попаданий),
+# который понимают flamegraph.pl и speedscope, в каталог PROFILER_DIR,
+# где хранится не больше PROFILER_MAX_FILES последних файлов.
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """
+    Статистический профилировщик одного потока
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profiler", daemon=True
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_stack(frame)] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def _trim_ring(directory, limit):
+    # имена начинаются со времени, поэтому сортировка дает порядок записи
+    names = sorted(
+        name for name in os.listdir(directory) if name.endswith(".collapsed")
+    )
+    for name in names[: max(len(names) - limit, 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # файл уже удалил другой воркер
+            pass
+
+
+def save_profile(sampler, view, queries, seconds):
+    """
+    Пишет стеки в кольцо PROFILER_DIR и возвращает имя файла
+    """
+    directory = settings.PROFILER_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = (
+        f"{time.time_ns()}-{os.getpid()}-{view}-{queries}q-"
+        f"{round(seconds * 1000)}ms.collapsed"
+    )
+    with open(os.path.join(directory, name), "w") as out:
+        out.write(sampler.collapsed())
+    _trim_ring(directory, settings.PROFILER_MAX_FILES)
+    return name
+
+
+class ProfilerMiddleware:
+    """
+    Профилирует выбранные запросы, см. описание модуля. Стоит после
+    AuthenticationMiddleware, чтобы видеть request.user.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = (
+            "HTTP_X_PROFILE" in request.META and request.user.is_staff
+        )
+        sampled = random.random() < settings.PROFILER_SAMPLE_RATE
+        if not (requested or sampled):
+            return self.get_response(request)
+        timings = timing.current.get()
+        queries = timings.queries if timings else 0
+        started = time.perf_counter()
+        sampler = Sampler(threading.get_ident(), settings.PROFILER_INTERVAL)
+        with sampler:
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+        if timings:
+            queries = timings.queries - queries
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name or "unnamed") if match else "unresolved"
+        name = save_profile(sampler, view, queries, seconds)
+        if requested:
+            response["X-Profile-File"] = name
+        return response
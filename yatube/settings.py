@@ -75,11 +75,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # первым, чтобы замер охватывал все остальные middleware
+    "yatube.timing.ServerTimingMiddleware",
+    "yatube.nplusone.NPlusOneMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # после аутентификации: профилирование по заголовку только для сотрудников
+    "yatube.profiling.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
@@ -90,7 +95,8 @@ ROOT_URLCONF = "yatube.urls"
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates с замером времени рендеринга (yatube/timing.py)
+        "BACKEND": "yatube.timing.TimedDjangoTemplates",
         "DIRS": [TEMPLATES_DIR],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -175,6 +181,37 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 # Temporary directory for testing media upload only. It will be empty after tests.
 MEDIA_ROOT_TEST = os.path.join(BASE_DIR, "media_test")
 
+# Миниатюры картинок постов строятся заранее (posts/thumbnails.py)
+THUMBNAIL_BACKEND = "posts.thumbnails.ThumbnailBackend"
+THUMBNAIL_KVSTORE = "posts.thumbnails.KVStore"
+# размеры миниатюр: имя -> (геометрия sorl, параметры)
+POST_THUMBNAILS = {
+    "post_card": ("960x500", {"crop": "center", "upscale": True}),
+}
+# варианты картинок постов для srcset: ширины, форматы, пропорции кадра
+POST_IMAGE_WIDTHS = (480, 960)
+POST_IMAGE_FORMATS = ("webp", "jpeg")
+POST_IMAGE_ASPECT = (960, 500)
+POST_IMAGE_QUALITY = 80
+# число потоков, которые строят миниатюры, 0 - строить сразу при сохранении
+POST_THUMBNAIL_WORKERS = env.int("POST_THUMBNAIL_WORKERS", default=2)
+# через сколько секунд снова пробовать картинку, миниатюры которой
+# построить не удалось (битый или нечитаемый файл)
+POST_THUMBNAIL_RETRY_AFTER = env.int("POST_THUMBNAIL_RETRY_AFTER", default=15 * 60)
+
+# Загрузка картинок постов (posts/uploads.py)
+# максимальный размер файла в формах постов, байты сверх него
+# не читаются в память (posts.decorators.bounded_uploads)
+POST_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+# максимальное разрешение по заголовку файла, защита от «бомб»
+POST_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+# картинка перекодируется без EXIF и уменьшается до этой стороны
+POST_IMAGE_MAX_DIMENSION = 2560
+POST_UPLOAD_QUALITY = 90
+# недавно загруженные картинки не удаляются вместе с постом, а остаются
+# collect_media_garbage: ту же картинку мог загрузить незакоммиченный пост
+POST_IMAGE_RELEASE_GRACE = env.int("POST_IMAGE_RELEASE_GRACE", default=60 * 60)
+
 # Login
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
@@ -188,24 +225,106 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 SITE_ID = 1
 
 # Logging
-if DEBUG:
-    LOGGING = {
-        "version": 1,
-        "disable_existing_loggers": False,
-        "handlers": {
-            "console": {"level": "DEBUG", "class": "logging.StreamHandler"}
+# по строке JSON на запрос: представление, статус, запросы к базе, время
+# SQL и рендеринга (yatube/timing.py)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"message": {"format": "%(message)s"}},
+    "handlers": {
+        "console": {"level": "DEBUG", "class": "logging.StreamHandler"},
+        "requests": {
+            "class": "logging.StreamHandler",
+            "formatter": "message",
         },
-        "loggers": {
-            "django.db.backends": {"handlers": ["console"], "level": "DEBUG"}
+    },
+    "loggers": {
+        "yatube.requests": {
+            "handlers": ["requests"],
+            "level": env("REQUEST_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
+        "yatube.nplusone": {
+            "handlers": ["requests"],
+            "level": "WARNING",
+            "propagate": False,
         },
+    },
+}
+if DEBUG:
+    LOGGING["loggers"]["django.db.backends"] = {
+        "handlers": ["console"],
+        "level": "DEBUG",
     }
+# время SQL и рендеринга в заголовке ответа Server-Timing; по умолчанию
+# выключено, заголовок видят все посетители
+SERVER_TIMING_HEADER = env.bool("SERVER_TIMING_HEADER", default=False)
+
+# Метрики (yatube/metrics.py): каждый процесс пишет свои значения
+# в METRICS_DIR, страница /metrics отдает их сумму. Каталог нужно
+# очищать при перезапуске gunicorn, иначе счетчики старых воркеров
+# останутся в сумме.
+METRICS_DIR = env("METRICS_DIR", default=os.path.join(BASE_DIR, "metrics"))
+METRICS_FLUSH_INTERVAL = env.float("METRICS_FLUSH_INTERVAL", default=5)
+# с каких адресов можно читать /metrics
+METRICS_ALLOWED_IPS = env.list(
+    "METRICS_ALLOWED_IPS", default=["127.0.0.1", "::1"]
+)
+
+# Профилирование запросов (yatube/profiling.py): по заголовку X-Profile
+# от сотрудника или случайная доля запросов
+PROFILER_SAMPLE_RATE = env.float("PROFILER_SAMPLE_RATE", default=0.0)
+# период снятия стеков, секунды
+PROFILER_INTERVAL = 0.005
+PROFILER_DIR = env("PROFILER_DIR", default=os.path.join(BASE_DIR, "profiles"))
+PROFILER_MAX_FILES = env.int("PROFILER_MAX_FILES", default=100)
+
+# Поиск N+1 (yatube/nplusone.py): одинаковые по форме запросы к базе,
+# повторившиеся за один запрос к сайту NPLUSONE_THRESHOLD раз, пишутся
+# в лог yatube.nplusone, а при NPLUSONE_RAISE запрос завершается ошибкой
+NPLUSONE_ENABLED = env.bool("NPLUSONE_ENABLED", default=True)
+NPLUSONE_THRESHOLD = env.int("NPLUSONE_THRESHOLD", default=5)
+NPLUSONE_RAISE = False
+# регулярные выражения для форм SQL, которые повторяются законно
+NPLUSONE_IGNORE = []
 
 # Cache
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-    }
-}
+
+
+def get_cache():
+    """ Set shared file-based cache for development and CACHE_URL for production"""
+    try:
+        # Parse cache url strings like memcache://127.0.0.1:11211 or filecache:///var/tmp/yatube
+        # read os.environ['CACHE_URL'] and raises ImproperlyConfigured exception if not found
+        cache = env.cache()
+    except ImproperlyConfigured:
+        # файловый кеш общий для всех воркеров gunicorn на одном сервере,
+        # в отличие от LocMemCache, который у каждого процесса свой
+        cache = {
+            "BACKEND": "yatube.cache.FileBasedCache",
+            "LOCATION": os.path.join(BASE_DIR, "cache"),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    # у файлового кеша Django неатомарный add, на нем держится
+    # блокировка пересчета лент (yatube/cache.py)
+    if cache["BACKEND"] == "django.core.cache.backends.filebased.FileBasedCache":
+        cache["BACKEND"] = "yatube.cache.FileBasedCache"
+    # префикс и версия позволяют нескольким инсталляциям (или релизам)
+    # делить один кеш, не видя ключей друг друга
+    cache["KEY_PREFIX"] = env("CACHE_KEY_PREFIX", default="yatube")
+    cache["VERSION"] = env.int("CACHE_VERSION", default=1)
+    cache["KEY_FUNCTION"] = env(
+        "CACHE_KEY_FUNCTION", default="yatube.cache.make_key"
+    )
+    return cache
+
+
+CACHES = {"default": get_cache()}
+
+# время жизни закешированных фрагментов лент. Фрагменты сбрасываются
+# сразу при изменении постов, комментариев и подписок (posts/generations.py),
+# поэтому время жизни может быть большим
+FEED_CACHE_TIMEOUT = env.int("FEED_CACHE_TIMEOUT", default=60 * 60)
 
 # disable cache during testing
 TEST_CACHES = {
@@ -215,6 +334,16 @@ TEST_CACHES = {
 }
 
 
+# Лента подписок
+# у авторов с таким числом подписчиков посты не раскладываются по лентам
+# при публикации, а подтягиваются при чтении ленты
+TIMELINE_CELEBRITY_THRESHOLD = env.int(
+    "TIMELINE_CELEBRITY_THRESHOLD", default=1000
+)
+# сколько последних постов автора попадает в ленту при подписке на него
+TIMELINE_BACKFILL_SIZE = 100
+
+
 # disable captcha
 # disable captcha during testing(you must manually set True)
 CAPTCHA_TEST_MODE = False
@@ -0,0 +1,131 @@
+import contextvars
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+
+logger = logging.getLogger("yatube.requests")
+
+# Легкий замер запросов в продакшене: количество и время SQL через
+# execute_wrapper соединений, время рендеринга шаблонов через бэкенд
+# шаблонов, итог - заголовок Server-Timing и строка JSON в лог.
+# Счетчики текущего запроса лежат в contextvar, как stale_served
+# в yatube/cache.py.
+
+current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """
+    Счетчики одного запроса
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        # глубина вложенных рендерингов, время считается по внешнему
+        self.rendering = 0
+
+    def execute(self, execute, sql, params, many, context):
+        # обертка выполнения SQL (connection.execute_wrapper)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = current.get()
+        if timings is None:
+            return super().render(context, request)
+        timings.rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.rendering -= 1
+            if not timings.rendering:
+                timings.render += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Бэкенд шаблонов Django, который засекает время рендеринга
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class ServerTimingMiddleware:
+    """
+    Считает запросы к базе и время SQL и рендеринга, отдает их
+    в заголовке Server-Timing, пишет строку JSON в лог yatube.requests
+    и в метрики запросов (yatube/metrics.py)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = current.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        total = time.perf_counter() - started
+        if settings.SERVER_TIMING_HEADER:
+            response["Server-Timing"] = (
+                f'db;dur={_ms(timings.db)};desc="{timings.queries} queries", '
+                f"render;dur={_ms(timings.render)}, "
+                f"total;dur={_ms(total)}"
+            )
+        match = getattr(request, "resolver_match", None)
+        logger.info(
+            json.dumps(
+                {
+                    "view": match.view_name if match else None,
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "queries": timings.queries,
+                    "db_ms": _ms(timings.db),
+                    "render_ms": _ms(timings.render),
+                    "total_ms": _ms(total),
+                },
+                ensure_ascii=False,
+            )
+        )
+        view = (match.url_name or "unnamed") if match else "unresolved"
+        metrics.inc(
+            "yatube_requests_total", view=view, status=response.status_code
+        )
+        metrics.observe("yatube_request_duration_seconds", total, view=view)
+        metrics.observe("yatube_request_queries", timings.queries, view=view)
+        metrics.flush()
+        return response
@@ -21,6 +21,8 @@ from django.conf.urls import handler404, handler500, url
 from django.conf import settings
 from django.conf.urls.static import static
 
+from yatube import metrics
+
 
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
@@ -55,6 +57,11 @@ urlpatterns += [
     path("contacts/", views.flatpage, {"url": "/contacts/"}, name="contacts"),
 ]
 
+# метрики для локального сборщика
+urlpatterns += [
+    path("metrics", metrics.scrape, name="metrics"),
+]
+
 # путь для captcha
 urlpatterns += [
     url(r"^captcha/", include("captcha.urls")),